@@ -0,0 +1,250 @@
+import os
+import re
+import logging
+from typing import Dict, List, Tuple
+from langchain_core.documents import Document
+from cache import content_hash
+from tokens import count_tokens, truncate_tokens
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PDF_CHUNK_TOKENS = int(os.getenv("PDF_CHUNK_TOKENS", "128"))
+PDF_CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", "20"))
+PDF_SECTION_HEADINGS = [
+    h.strip() for h in os.getenv(
+        "PDF_SECTION_HEADINGS",
+        "Tagline,Features,Description,Eligibility,Benefits,Risks,Fees,Charges,Terms and Conditions,Call to Action",
+    ).split(",") if h.strip()
+]
+
+# A line that is a heading on its own: markdown-style, "Short Title:" or ALL CAPS
+_LINE_HEADING = re.compile(r"^(#{1,6}\s+.+|[A-Z][\w &/()'-]{1,60}:|[A-Z0-9][A-Z0-9 &/()'-]{2,60})$")
+# Table rows: pipe-delimited, or three or more columns separated by tabs / wide gaps
+_TABLE_ROW = re.compile(r"\|.*\||\S(?:\t| {3,})\S.*?(?:\t| {3,})\S")
+_INLINE_HEADING = re.compile(r"(?<![\w-])(" + "|".join(map(re.escape, PDF_SECTION_HEADINGS)) + r")\s*:") if PDF_SECTION_HEADINGS else None
+# Sentence ends and list bullets are the preferred split points inside a section
+_UNIT_BREAK = re.compile(r"(?<=[.!?])\s+|\s*(?=[●•▪])")
+_LEADING_SYMBOLS = re.compile(r"^[^\w₹]+")
+
+
+def signature() -> str:
+    """Changes whenever the chunker's output would, so the ingest manifest re-embeds."""
+    return content_hash("chunker-v1", str(PDF_CHUNK_TOKENS), str(PDF_CHUNK_OVERLAP), ",".join(PDF_SECTION_HEADINGS))
+
+
+def _lines(text: str) -> List[str]:
+    lines = [line.strip() for line in text.splitlines()]
+    non_empty = [line for line in lines if line]
+    words = sum(len(line.split()) for line in non_empty)
+    if len(non_empty) > 20 and words / len(non_empty) < 1.5:
+        # Some PDF renderers emit one word per line; that line structure means nothing
+        return [" ".join(non_empty)]
+    return lines
+
+
+def _sections(text: str) -> Tuple[str, List[Dict]]:
+    """Split page text into (title, [{"section", "kind", "lines"}]) blocks."""
+    blocks = []
+    current = {"section": "", "kind": "text", "lines": []}
+
+    def start(section: str, kind: str = "text"):
+        nonlocal current
+        if current["lines"]:
+            blocks.append(current)
+        current = {"section": section, "kind": kind, "lines": []}
+
+    for line in _lines(text):
+        if not line:
+            continue
+        if _TABLE_ROW.search(line):
+            if current["kind"] != "table":
+                start(current["section"], "table")
+            current["lines"].append(line)
+            continue
+        if current["kind"] == "table":
+            start(current["section"])
+        if len(line.split()) <= 8 and _LINE_HEADING.match(line):
+            start(line.strip("#: \t"))
+            current["lines"].append(line)
+            continue
+        parts = _INLINE_HEADING.split(line) if _INLINE_HEADING else [line]
+        if parts[0].strip():
+            current["lines"].append(parts[0].strip())
+        for heading, body in zip(parts[1::2], parts[2::2]):
+            start(heading)
+            current["lines"].append(f"{heading}: {body.strip()}".strip())
+    start("")
+
+    title = ""
+    if blocks and not blocks[0]["section"] and blocks[0]["kind"] == "text":
+        lead = " ".join(blocks[0]["lines"])
+        if len(lead.split()) <= 12:
+            title = _LEADING_SYMBOLS.sub("", lead).strip()
+            blocks = blocks[1:]
+    return title, blocks
+
+
+def _units(block: Dict, budget: int) -> List[str]:
+    if block["kind"] == "table":
+        units = block["lines"]
+    else:
+        units = [u.strip() for u in _UNIT_BREAK.split(" ".join(block["lines"])) if u and u.strip()]
+    pieces = []
+    for unit in units:
+        if count_tokens(unit) <= budget:
+            pieces.append(unit)
+            continue
+        # A single sentence longer than a chunk: fall back to word groups
+        words, group = unit.split(), []
+        for word in words:
+            if group and count_tokens(" ".join(group + [word])) > budget:
+                pieces.append(" ".join(group))
+                group = []
+            group.append(word)
+        if group:
+            pieces.append(" ".join(group))
+    return pieces
+
+
+def split_page(page: Document, chunk_tokens: int = PDF_CHUNK_TOKENS, overlap_tokens: int = PDF_CHUNK_OVERLAP) -> List[Document]:
+    """
+    Split one page into chunks of at most ~chunk_tokens. Whole sections are
+    packed together while they fit; a section that does not fit starts a new
+    chunk, and a section larger than a chunk is split at sentence, bullet or
+    table-row boundaries with overlap_tokens of carry-over (table chunks repeat
+    the header row instead). Every chunk is prefixed with the page title.
+
+    metadata["body_offset"] marks where text not already present in the
+    previous chunk begins, so adjacent chunks can be stitched back together.
+    """
+    title, blocks = _sections(page.page_content)
+
+    def prefix(section: str = "") -> str:
+        label = " | ".join(p for p in (title, section) if p)
+        return f"{label}: " if label else ""
+
+    # (sections, text, carried_chars, continues_a_section)
+    chunks = []
+    packed, packed_sections = [], []
+    for block in blocks:
+        is_table = block["kind"] == "table"
+        join = "\n".join if is_table else " ".join
+        block_text = join(block["lines"])
+        if count_tokens(prefix() + "\n".join(packed + [block_text])) <= chunk_tokens:
+            packed.append(block_text)
+            packed_sections.append(block["section"])
+            continue
+        if packed:
+            chunks.append((packed_sections, "\n".join(packed), 0, False))
+            packed, packed_sections = [], []
+        if count_tokens(prefix() + block_text) <= chunk_tokens:
+            packed, packed_sections = [block_text], [block["section"]]
+            continue
+
+        # Oversized section: split it on its own; continuation chunks name the section
+        header = block["lines"][0] if is_table else ""
+        budget = max(chunk_tokens - count_tokens(prefix(block["section"]) + header) - 1, 16)
+        current, carried, continued = [], 0, False
+        for unit in _units(block, budget):
+            if current and count_tokens(join(current + [unit])) > budget:
+                chunks.append(([block["section"]], join(current), carried, continued))
+                continued = True
+                if is_table:
+                    current, carried = [header], len(header) + 1
+                else:
+                    tail = []
+                    for previous in reversed(current):
+                        if count_tokens(join([previous] + tail)) > overlap_tokens:
+                            break
+                        tail.insert(0, previous)
+                    current, carried = tail, len(join(tail)) + 1 if tail else 0
+            current.append(unit)
+        if current:
+            chunks.append(([block["section"]], join(current), carried, continued))
+    if packed:
+        chunks.append((packed_sections, "\n".join(packed), 0, False))
+
+    documents = []
+    for index, (sections, body, carried, continued) in enumerate(chunks):
+        head = prefix(sections[0]) if continued else prefix()
+        text = head + body
+        documents.append(Document(
+            page_content=text,
+            metadata={
+                **page.metadata,
+                "title": title,
+                "section": ", ".join(s for s in sections if s),
+                "chunk": index,
+                "body_offset": len(head) + carried,
+                "tokens": count_tokens(text),
+            },
+        ))
+    return documents
+
+
+def _position(doc: Document):
+    meta = doc.metadata
+    return meta.get("source"), meta.get("page"), meta.get("chunk")
+
+
+def assemble_context(documents: List[Document], max_tokens: int) -> List[str]:
+    """
+    Turn ranked chunks into ranked passages: duplicates are dropped, chunks
+    adjacent on the same page are stitched into one passage (without their
+    overlap), and passages are kept in rank order until max_tokens is spent.
+    """
+    passages = []
+    located = {}
+    for doc in documents:
+        source, page, chunk = _position(doc)
+        if chunk is None:
+            passages.append({doc.page_content: doc})
+            continue
+        if (source, page, chunk) in located:
+            continue
+        neighbours = sorted({
+            located[key] for key in ((source, page, chunk - 1), (source, page, chunk + 1)) if key in located
+        })
+        if not neighbours:
+            neighbours = [len(passages)]
+            passages.append({})
+        target = neighbours[0]
+        for other in neighbours[1:]:
+            # This chunk bridges two passages: fold the lower-ranked one into the other
+            for index, moved in passages[other].items():
+                passages[target][index] = moved
+                located[(source, page, index)] = target
+            passages[other] = {}
+        passages[target][chunk] = doc
+        located[(source, page, chunk)] = target
+
+    rendered = []
+    for passage in filter(None, passages):
+        text, previous = "", None
+        # A passage holds either chunk indices (ints, sorted numerically) or one page_content key
+        for key in sorted(passage):
+            doc = passage[key]
+            if previous is not None and isinstance(key, int) and key == previous + 1:
+                text += "\n" + doc.page_content[doc.metadata.get("body_offset", 0):]
+            else:
+                text += ("\n" if text else "") + doc.page_content
+            previous = key if isinstance(key, int) else None
+        rendered.append(text)
+
+    selected, remaining = [], max_tokens
+    for text in rendered:
+        tokens = count_tokens(text)
+        if tokens <= remaining:
+            selected.append(text)
+            remaining -= tokens
+        elif not selected:
+            # The best passage alone is over budget: keep its head rather than nothing
+            selected.append(truncate_tokens(text, remaining))
+            remaining = 0
+        if remaining <= 0:
+            break
+    logger.info(f"Brochure context: {len(documents)} chunks -> {len(selected)} passages, {max_tokens - remaining} tokens")
+    return selected
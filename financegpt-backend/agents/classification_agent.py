@@ -1,21 +1,67 @@
 import os
-from openai import OpenAI
+import logging
+import llm
+import metrics
+from cache import LRUTTLCache, normalize_query, content_hash
+from agents.local_classifier import LocalClassifier
 from prompts.classification_prompt import CLASSIFICATION_PROMPT
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", "2048"))
+CLASSIFICATION_CACHE_TTL = float(os.getenv("CLASSIFICATION_CACHE_TTL", "86400"))
+CLASSIFICATION_CACHE_PATH = os.getenv("CLASSIFICATION_CACHE_PATH")
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() == "true"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85"))
+
 class ClassificationAgent:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Keys carry a hash of the prompt, so editing CLASSIFICATION_PROMPT
+        # makes every earlier entry (in memory or on disk) unreachable.
+        self.key_prefix = f"{content_hash(CLASSIFICATION_PROMPT)}:"
+        self.cache = LRUTTLCache(maxsize=CLASSIFICATION_CACHE_SIZE, ttl=CLASSIFICATION_CACHE_TTL)
+        if CLASSIFICATION_CACHE_PATH:
+            self.cache.load(CLASSIFICATION_CACHE_PATH, key_prefix=self.key_prefix)
+        self.local_classifier = LocalClassifier() if LOCAL_CLASSIFIER_ENABLED else None
+        self.local_answers = 0
+        self.llm_fallbacks = 0
+        metrics.register("classification_cache", self.cache.stats)
+        metrics.register("classification", self.stats)
 
-    def process_query(self, user_query: str):
+    async def process_query(self, user_query: str):
+        key = self.key_prefix + normalize_query(user_query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"Classification cache hit for query '{user_query}': {cached}")
+            return list(cached)
+        if self.local_classifier:
+            categories, confidence = self.local_classifier.predict(user_query)
+            if categories and confidence >= LOCAL_CLASSIFIER_THRESHOLD:
+                self.local_answers += 1
+                logger.info(f"Local classifier answered '{user_query}': {categories} (confidence {confidence:.2f})")
+                return categories
+            self.llm_fallbacks += 1
         prompt = CLASSIFICATION_PROMPT.format(query=user_query)
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        categories = response.choices[0].message.content.strip()
+        categories = (await llm.complete(prompt, temperature=0)).strip()
         # Split and clean the categories
-        return [cat.strip() for cat in categories.split(',') if cat.strip()] 
\ No newline at end of file
+        categories = [cat.strip() for cat in categories.split(',') if cat.strip()]
+        if categories:
+            self.cache.set(key, categories)
+        return list(categories)
+
+    def stats(self) -> dict:
+        return {
+            "local_model": "trained" if self.local_classifier and self.local_classifier.trained else "rules-only",
+            "local_answers": self.local_answers,
+            "llm_fallbacks": self.llm_fallbacks,
+        }
+
+    def save_cache(self):
+        if CLASSIFICATION_CACHE_PATH:
+            try:
+                self.cache.save(CLASSIFICATION_CACHE_PATH)
+            except Exception as e:
+                logger.error(f"Failed to save classification cache: {str(e)}")
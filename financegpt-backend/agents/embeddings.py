@@ -0,0 +1,252 @@
+import os
+import re
+import abc
+import sys
+import json
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from cache import normalize_query
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "384"))
+ONNX_MAX_TOKENS = int(os.getenv("ONNX_MAX_TOKENS", "256"))
+
+DEFAULT_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "local": f"hash-{LOCAL_EMBEDDING_DIM}",
+    "onnx": "models/embedding",
+}
+
+
+class EmbeddingCache:
+    """On-disk (SQLite) store of embeddings keyed by sha256(model, text)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(blob, dtype=np.float32).tolist()) for key, blob in rows)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class EmbeddingProvider(Embeddings, abc.ABC):
+    """
+    Base for embedding backends. Subclasses implement _embed_batch; this class
+    serves hits from the on-disk cache and sends misses in EMBEDDING_BATCH_SIZE
+    batches. Usable anywhere LangChain expects an Embeddings object.
+    """
+
+    provider = ""
+
+    def __init__(self, model: str, cache: Optional[EmbeddingCache] = None, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.cache_hits = 0
+        self.embedded = 0
+        self.batches = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    @property
+    def collection_name(self) -> str:
+        """Chroma collection for this provider and model, so switching never mixes vector spaces."""
+        slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", f"{self.provider}-{os.path.basename(self.model)}").strip("-._")
+        digest = hashlib.sha256(self.name.encode("utf-8")).hexdigest()[:8]
+        return f"brochures_{slug[:40]}_{digest}"
+
+    @abc.abstractmethod
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the backend, one vector per text, in order."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self.name, text) for text in texts]
+        cached = self.cache.get_many(list(set(keys))) if self.cache is not None else {}
+        self.cache_hits += sum(1 for key in keys if key in cached)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = self._embed_batch([text for _, text in batch])
+            fresh = {key: [float(v) for v in vector] for (key, _), vector in zip(batch, vectors)}
+            if self.cache is not None:
+                self.cache.put_many(fresh)
+            cached.update(fresh)
+            self.embedded += len(batch)
+            self.batches += 1
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict:
+        return {
+            "provider": self.name,
+            "cache_hits": self.cache_hits,
+            "embedded": self.embedded,
+            "batches": self.batches,
+        }
+
+
+class OpenAIProvider(EmbeddingProvider):
+    provider = "openai"
+
+    def __init__(self, model: str, **kwargs):
+        super().__init__(model, **kwargs)
+        from langchain_openai import OpenAIEmbeddings
+        self._client = OpenAIEmbeddings(model=model)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self._client.embed_documents(texts)
+
+
+class LocalHashProvider(EmbeddingProvider):
+    """
+    Deterministic feature-hashing embeddings (word stems and character
+    trigrams): no network, no model files. Meant for tests and air-gapped
+    deployments; similarity is lexical rather than semantic.
+    """
+
+    provider = "local"
+
+    def __init__(self, model: str, dim: int = LOCAL_EMBEDDING_DIM, **kwargs):
+        super().__init__(model, **kwargs)
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = normalize_query(text).split()
+        trigrams = [w[i:i + 3] for w in words if len(w) > 3 for i in range(len(w) - 2)]
+        return words + [f"#{t}" for t in trigrams]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.maximum(norms, 1e-9)).tolist()
+
+
+class ONNXProvider(EmbeddingProvider):
+    """
+    Sentence-embedding model exported to ONNX (e.g. a MiniLM/BGE export) run
+    with onnxruntime. The model directory holds model.onnx and the Hugging Face
+    tokenizer.json; token embeddings are mean-pooled and L2-normalized.
+    """
+
+    provider = "onnx"
+
+    def __init__(self, model: str, **kwargs):
+        super().__init__(model, **kwargs)
+        import onnxruntime
+        from tokenizers import Tokenizer
+        self._tokenizer = Tokenizer.from_file(os.path.join(model, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=ONNX_MAX_TOKENS)
+        self._tokenizer.enable_padding()
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(model, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self._session.get_inputs()}
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        encoded = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+        output = self._session.run(None, {name: value for name, value in feeds.items() if name in self._inputs})[0]
+        if output.ndim == 3:
+            weights = mask[..., None].astype(np.float32)
+            output = (output * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.maximum(norms, 1e-9)).tolist()
+
+
+PROVIDERS = {"openai": OpenAIProvider, "local": LocalHashProvider, "onnx": ONNXProvider}
+
+_caches = {}
+_cache_lock = threading.Lock()
+
+
+def _shared_cache(path: str) -> Optional[EmbeddingCache]:
+    if not path:
+        return None
+    with _cache_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path)
+        return _caches[path]
+
+
+def get_provider(name: str = None, model: str = None, cache_path: str = None) -> EmbeddingProvider:
+    name = name or EMBEDDING_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER {name!r}; expected one of {', '.join(PROVIDERS)}")
+    model = model or EMBEDDING_MODEL or DEFAULT_MODELS[name]
+    cache = _shared_cache(EMBEDDING_CACHE_PATH if cache_path is None else cache_path)
+    provider = PROVIDERS[name](model, cache=cache)
+    logger.info(f"Using embedding provider {provider.name} (collection {provider.collection_name})")
+    return provider
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embed text with the configured provider (smoke test)")
+    parser.add_argument("texts", nargs="+")
+    parser.add_argument("--provider", default=None)
+    parser.add_argument("--model", default=None)
+    args = parser.parse_args(argv)
+    provider = get_provider(args.provider, args.model)
+    vectors = provider.embed_documents(args.texts)
+    print(json.dumps({**provider.stats(), "dimensions": len(vectors[0])}, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+from agents import chunking
+from agents.embeddings import EMBEDDING_BATCH_SIZE, get_provider
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_pdf(pdf_path: str):
+    """Parse one PDF into page Documents. Runs in a worker process."""
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(pdf_path, mode="page").load()
+
+
+def parse_pdfs(pdf_paths: List[str], workers: int = INGEST_WORKERS) -> Dict[str, list]:
+    if not pdf_paths:
+        return {}
+    if workers <= 1 or len(pdf_paths) == 1:
+        return {path: parse_pdf(path) for path in pdf_paths}
+    with ProcessPoolExecutor(max_workers=min(workers, len(pdf_paths))) as executor:
+        return dict(zip(pdf_paths, executor.map(parse_pdf, pdf_paths)))
+
+
+class Manifest:
+    """
+    Records, per brochure, the file hash and for each page its content hash and
+    the chunk vector ids it was stored under, so a sync only touches what
+    changed. Page hashes include the chunker signature.
+    """
+
+    def __init__(self, directory: str, collection: str):
+        self.path = os.path.join(directory, f"ingest_manifest.{collection}.json")
+        self.files = {}
+        self.chunker = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.chunker = data.get("chunker")
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"chunker": self.chunker, "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def sync_index(store, pdf_directory: str, collection: str, directory: str = CHROMA_DIR,
+               workers: int = INGEST_WORKERS, batch_size: int = EMBEDDING_BATCH_SIZE, rebuild: bool = False) -> Dict:
+    """
+    Bring the vector store in line with the PDFs in pdf_directory: embed new or
+    changed pages, delete vectors of removed pages and skip everything else.
+    """
+    started = time.perf_counter()
+    manifest = Manifest(directory, collection)
+    existing = store.get(include=[])["ids"]
+    if rebuild or (existing and not manifest.exists):
+        # Index built before the manifest existed (or a forced rebuild): ids are unknown, start over
+        if existing:
+            logger.info(f"Clearing {len(existing)} vectors from an untracked index")
+            store.delete(ids=existing)
+        manifest.files = {}
+
+    chunker = chunking.signature()
+    if manifest.chunker != chunker:
+        # Chunking settings changed: every page hash changes with them, so all files are re-chunked
+        for entry in manifest.files.values():
+            entry["sha256"] = None
+        manifest.chunker = chunker
+
+    pdf_files = sorted(f for f in os.listdir(pdf_directory) if f.endswith(".pdf"))
+    file_hashes = {}
+    for name in pdf_files:
+        with open(os.path.join(pdf_directory, name), "rb") as f:
+            file_hashes[name] = _sha256(f.read())
+    to_parse = [name for name in pdf_files if manifest.files.get(name, {}).get("sha256") != file_hashes[name]]
+    parsed = parse_pdfs([os.path.join(pdf_directory, name) for name in to_parse], workers)
+
+    stale_ids, pending = [], []
+    pages_total = pages_skipped = 0
+    for name in set(manifest.files) - set(pdf_files):
+        for page in manifest.files.pop(name)["pages"].values():
+            stale_ids.extend(page["ids"])
+    for name in pdf_files:
+        entry = manifest.files.get(name, {"pages": {}})
+        if name not in to_parse:
+            pages_total += len(entry["pages"])
+            pages_skipped += len(entry["pages"])
+            continue
+        old_pages = entry["pages"]
+        new_pages = {}
+        for page in parsed[os.path.join(pdf_directory, name)]:
+            pages_total += 1
+            page_key = str(page.metadata.get("page", len(new_pages)))
+            page_hash = _sha256((chunker + page.page_content).encode("utf-8"))
+            previous = old_pages.pop(page_key, None)
+            if previous and previous["hash"] == page_hash:
+                new_pages[page_key] = previous
+                pages_skipped += 1
+                continue
+            if previous:
+                stale_ids.extend(previous["ids"])
+            chunks = chunking.split_page(page)
+            ids = [f"{name}:{page_key}:{i}" for i in range(len(chunks))]
+            new_pages[page_key] = {"hash": page_hash, "ids": ids}
+            pending.extend(zip(ids, chunks))
+        for page in old_pages.values():
+            stale_ids.extend(page["ids"])
+        manifest.files[name] = {"sha256": file_hashes[name], "pages": new_pages}
+
+    if stale_ids:
+        store.delete(ids=stale_ids)
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        store.add_texts(
+            texts=[chunk.page_content for _, chunk in batch],
+            metadatas=[chunk.metadata for _, chunk in batch],
+            ids=[chunk_id for chunk_id, _ in batch],
+        )
+    manifest.save()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "files": len(pdf_files),
+        "files_parsed": len(to_parse),
+        "pages": pages_total,
+        "pages_skipped": pages_skipped,
+        "chunks_embedded": len(pending),
+        "vectors_deleted": len(stale_ids),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages_total / elapsed, 1) if elapsed else None,
+    }
+    logger.info(f"Brochure index sync: {report}")
+    return report
+
+
+def open_store(provider, directory: str = CHROMA_DIR):
+    """Each embedding provider/model gets its own collection, so switching needs no cleanup."""
+    from langchain_community.vectorstores import Chroma
+    from chromadb.config import Settings
+    return Chroma(
+        collection_name=provider.collection_name,
+        embedding_function=provider,
+        persist_directory=directory,
+        client_settings=Settings(anonymized_telemetry=False, is_persistent=True)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally sync brochure PDFs into the Chroma index")
+    parser.add_argument("--pdf-dir", default="brochures")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--provider", default=None, help="embedding provider (defaults to EMBEDDING_PROVIDER)")
+    parser.add_argument("--rebuild", action="store_true", help="drop every vector and re-embed all pages")
+    args = parser.parse_args(argv)
+    provider = get_provider(args.provider)
+    store = open_store(provider)
+    report = sync_index(store, args.pdf_dir, provider.collection_name, workers=args.workers,
+                        batch_size=args.batch_size, rebuild=args.rebuild)
+    report["embedding"] = provider.stats()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
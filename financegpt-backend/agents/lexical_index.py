@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import Dict, List, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from cache import normalize_query
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PDF_LEXICAL_MAX_TERMS = int(os.getenv("PDF_LEXICAL_MAX_TERMS", "4"))
+PDF_RRF_K = int(os.getenv("PDF_RRF_K", "60"))
+
+_STOPWORDS = set("""
+a an the and or of to in on for with by at from is are was were be been it its this that these those as
+what which who whom how when where why do doe does did wa can could should would will shall may might i me my we
+our you your he she they them their there here about tell give show explain any all some more most much
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in normalize_query(text).split() if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory BM25 (Okapi) inverted index over brochure chunks. Postings are
+    NumPy arrays, so a query touches only the documents sharing a term with it.
+    """
+
+    def __init__(self, documents: List[Document] = None, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.postings = {}
+        self.idf = {}
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        if documents:
+            self.build(documents)
+
+    @classmethod
+    def from_store(cls, store) -> "BM25Index":
+        data = store.get(include=["documents", "metadatas"])
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        return cls(documents)
+
+    def build(self, documents: List[Document]):
+        started = time.perf_counter()
+        term_docs = {}
+        lengths = []
+        for index, doc in enumerate(documents):
+            tokens = tokenize(doc.page_content)
+            lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_docs.setdefault(token, []).append((index, tf))
+        n = len(documents)
+        self.documents = list(documents)
+        self.doc_lengths = np.array(lengths, dtype=np.float32)
+        self.postings = {
+            term: (np.array([d for d, _ in pairs], dtype=np.int32), np.array([tf for _, tf in pairs], dtype=np.float32))
+            for term, pairs in term_docs.items()
+        }
+        self.idf = {term: float(np.log(1 + (n - len(pairs) + 0.5) / (len(pairs) + 0.5))) for term, pairs in term_docs.items()}
+        logger.info(f"Built BM25 index over {n} chunks, {len(self.postings)} terms in {time.perf_counter() - started:.3f}s")
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        terms = set(tokenize(query))
+        if not self.documents or not terms:
+            return []
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(float(self.doc_lengths.mean()), 1.0))
+        for term in terms:
+            if term not in self.postings:
+                continue
+            docs, tf = self.postings[term]
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm[docs])
+        candidates = np.flatnonzero(scores)
+        # Stable tie-break on insertion order keeps results deterministic
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+        return [(self.documents[i], float(scores[i])) for i in ranked]
+
+    def is_keyword_query(self, query: str) -> bool:
+        """
+        Short queries made only of indexed terms (product names, fee terms),
+        all present in the best lexical hit, are served without an embedding.
+        """
+        terms = set(tokenize(query))
+        if not terms or len(terms) > PDF_LEXICAL_MAX_TERMS or any(t not in self.postings for t in terms):
+            return False
+        top = self.search(query, 1)
+        return bool(top) and terms <= set(tokenize(top[0][0].page_content))
+
+
+def _key(doc: Document):
+    meta = doc.metadata
+    return meta.get("source"), meta.get("page"), meta.get("chunk"), None if "chunk" in meta else doc.page_content
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = PDF_RRF_K) -> List[Document]:
+    scores, documents, first_seen = {}, {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = _key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+            first_seen.setdefault(key, len(first_seen))
+    ordered = sorted(scores, key=lambda key: (-scores[key], first_seen[key]))
+    return [documents[key] for key in ordered[:k]]
+
+
+# --- Offline relevance / latency benchmark over the shipped brochure ---
+
+BENCH_QUERIES = [
+    ("Secure FD Plus premature withdrawal penalty", "Secure FD Plus"),
+    ("tax saving under 80C", "Secure FD Plus"),
+    ("I want a safe investment with no market risk for my parents", "Secure FD Plus"),
+    ("fuel surcharge waiver", "Cashback Credit Card"),
+    ("joining fee", "Cashback Credit Card"),
+    ("which card rewards me for shopping online", "Cashback Credit Card"),
+    ("SIP minimum investment", "Ultra Growth Fund"),
+    ("aggressive equity investment for long term growth", "Ultra Growth Fund"),
+    ("no collateral instant disbursal", "Smart Personal Loan"),
+    ("can I get money quickly for a medical emergency or wedding", "Smart Personal Loan"),
+    ("minimum monthly income eligibility for the loan", "Smart Personal Loan"),
+    ("Section 80CCC", "RetireSmart Pension Plan"),
+    ("surrender charges", "RetireSmart Pension Plan"),
+    ("which plan gives guaranteed monthly income after I retire", "RetireSmart Pension Plan"),
+]
+
+
+def _bench(agent, modes: List[str], k: int, iterations: int) -> Dict:
+    report = {}
+    for mode in modes:
+        hits_1 = hits_k = reciprocal = 0.0
+        latencies = []
+        for query, expected in BENCH_QUERIES:
+            for _ in range(iterations):
+                # Cold query embedding every time: the cache would hide the API call
+                agent.query_embedding_cache.invalidate()
+                started = time.perf_counter()
+                documents, used = agent.retrieve(query, k, mode)
+                latencies.append(time.perf_counter() - started)
+            titles = [doc.metadata.get("title") for doc in documents]
+            rank = titles.index(expected) + 1 if expected in titles else None
+            hits_1 += rank == 1
+            hits_k += rank is not None
+            reciprocal += 1 / rank if rank else 0
+        n = len(BENCH_QUERIES)
+        report[mode] = {
+            "hit@1": round(hits_1 / n, 3),
+            f"hit@{k}": round(hits_k / n, 3),
+            "mrr": round(reciprocal / n, 3),
+            "avg_ms": round(float(np.mean(latencies)) * 1000, 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark brochure retrieval modes on the shipped brochure")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--modes", default="vector,lexical,hybrid,auto")
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args(argv)
+    from agents.pdf_agent import PDFAgent
+    agent = PDFAgent()
+    print(json.dumps(_bench(agent, args.modes.split(","), args.k, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
@@ -0,0 +1,230 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import numpy as np
+from cache import normalize_query, content_hash
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LABELS = ["DB_QUERY", "PDF_EXTRACTION", "EXTERNAL_API"]
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", "data/local_classifier.npz")
+
+# Keyword rules give strong per-label evidence. Positive rules raise a label's
+# probability; the offers rule is also used negatively, since EXTERNAL_API is
+# only ever about promotions and third-party data. Without a trained model
+# every label starts undecided, and once any rule fires the labels no rule
+# fired for count as ruled out, so one clear hit can answer on its own.
+_RULES = [
+    (re.compile(r"\b(list|show|how many|count|which|available|all|compare|cheapest|highest|lowest|top|minimum|min|max|rates?)\b"), "DB_QUERY", 0.95),
+    (re.compile(r"\b(products?|fds?|fixed deposits?|mutual funds?|insurance|credit cards?|polic(y|ies)|plans?)\b"), "DB_QUERY", 0.9),
+    (re.compile(r"\b(features?|benefits?|terms?|conditions?|charges?|fees?|eligib\w*|documents?|how (do|does|can|to)|what is|explain|understand|details?|brochure|specifications?)\b"), "PDF_EXTRACTION", 0.95),
+    (re.compile(r"\b(offers?|promo\w*|cashback|discounts?|deals?|bonus(es)?|festive|campaign|coupons?)\b"), "EXTERNAL_API", 0.97),
+]
+_PRIORS = {"DB_QUERY": 0.5, "PDF_EXTRACTION": 0.5, "EXTERNAL_API": 0.5}
+
+
+def _features(text: str):
+    tokens = normalize_query(text).split()
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class LocalClassifier:
+    """
+    Keyword rules plus an optional TF-IDF one-vs-rest logistic model (NumPy only).
+    predict() returns (categories, confidence), where confidence is the least
+    certain per-label probability, so one ambiguous label sends the query to
+    the LLM.
+    """
+
+    def __init__(self, path: str = None):
+        self.vocab = {}
+        self.idf = None
+        self.weights = None
+        self.bias = None
+        path = path or LOCAL_CLASSIFIER_PATH
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @property
+    def trained(self) -> bool:
+        return self.weights is not None
+
+    def _vectorize(self, texts) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.vocab)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in _features(text):
+                column = self.vocab.get(feature)
+                if column is not None:
+                    matrix[row, column] += 1.0
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-9)
+
+    def fit(self, texts, label_sets, epochs: int = 400, learning_rate: float = 2.0, l2: float = 1e-4, min_df: int = 1):
+        doc_freq = {}
+        for text in texts:
+            for feature in set(_features(text)):
+                doc_freq[feature] = doc_freq.get(feature, 0) + 1
+        features = sorted(f for f, df in doc_freq.items() if df >= min_df)
+        self.vocab = {f: i for i, f in enumerate(features)}
+        df = np.array([doc_freq[f] for f in features], dtype=np.float32)
+        self.idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        x = self._vectorize(texts)
+        y = np.array([[1.0 if label in labels else 0.0 for label in LABELS] for labels in label_sets], dtype=np.float32)
+        self.weights = np.zeros((x.shape[1], len(LABELS)), dtype=np.float32)
+        self.bias = np.zeros(len(LABELS), dtype=np.float32)
+        for _ in range(epochs):
+            probs = 1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias)))
+            error = probs - y
+            self.weights -= learning_rate * (x.T @ error / len(texts) + l2 * self.weights)
+            self.bias -= learning_rate * error.mean(axis=0)
+        return self
+
+    def probabilities(self, query: str) -> dict:
+        if self.trained:
+            logits = self._vectorize([query])[0] @ self.weights + self.bias
+            probs = dict(zip(LABELS, (1.0 / (1.0 + np.exp(-logits))).tolist()))
+        else:
+            probs = dict(_PRIORS)
+        text = query.lower()
+        hits = {}
+        for pattern, label, strength in _RULES:
+            if pattern.search(text):
+                hits[label] = max(hits.get(label, 0.0), strength)
+                probs[label] = max(probs[label], strength)
+        if hits and not self.trained:
+            for label in LABELS:
+                if label not in hits:
+                    probs[label] = min(probs[label], 1 - max(hits.values()))
+        if not _RULES[-1][0].search(text):
+            probs["EXTERNAL_API"] = min(probs["EXTERNAL_API"], 1 - _RULES[-1][2])
+        return probs
+
+    def predict(self, query: str):
+        probs = self.probabilities(query)
+        categories = [label for label in LABELS if probs[label] >= 0.5]
+        confidence = min(max(p, 1 - p) for p in probs.values())
+        return categories, confidence
+
+    def save(self, path: str):
+        vocab = np.array(sorted(self.vocab, key=self.vocab.get))
+        np.savez_compressed(path, vocab=vocab, idf=self.idf, weights=self.weights, bias=self.bias)
+        logger.info(f"Saved local classifier ({len(vocab)} features) to {path}")
+
+    def load(self, path: str):
+        data = np.load(path, allow_pickle=False)
+        self.vocab = {str(f): i for i, f in enumerate(data["vocab"])}
+        self.idf = data["idf"]
+        self.weights = data["weights"]
+        self.bias = data["bias"]
+        logger.info(f"Loaded local classifier ({len(self.vocab)} features) from {path}")
+
+
+# --- Offline training and evaluation ---
+
+def _is_holdout(query: str, holdout: float) -> bool:
+    return int(content_hash(query), 16) % 1000 < holdout * 1000
+
+
+def _read_dataset(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def _label(args):
+    from sqlalchemy import func
+    from database import SessionLocal
+    from models.models import QueryLog
+    from prompts.classification_prompt import CLASSIFICATION_PROMPT
+    import llm
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(QueryLog.query, func.count(QueryLog.id))
+            .group_by(QueryLog.query)
+            .order_by(func.count(QueryLog.id).desc())
+            .limit(args.limit)
+            .all()
+        )
+    finally:
+        db.close()
+    with open(args.dataset, "w") as f:
+        for query, count in rows:
+            started = time.perf_counter()
+            output = await llm.complete(CLASSIFICATION_PROMPT.format(query=query), temperature=0)
+            latency = time.perf_counter() - started
+            labels = [cat.strip() for cat in output.split(",") if cat.strip() in LABELS]
+            f.write(json.dumps({"query": query, "labels": labels, "count": count, "llm_latency": latency}) + "\n")
+    print(f"Labelled {len(rows)} distinct queries from query_logs into {args.dataset}")
+
+
+def _train(args):
+    rows = [r for r in _read_dataset(args.dataset) if not _is_holdout(r["query"], args.holdout)]
+    classifier = LocalClassifier(path="").fit([r["query"] for r in rows], [r["labels"] for r in rows])
+    classifier.save(args.model)
+    print(f"Trained on {len(rows)} queries, saved to {args.model}")
+
+
+def _evaluate(args):
+    rows = [r for r in _read_dataset(args.dataset) if _is_holdout(r["query"], args.holdout)] or _read_dataset(args.dataset)
+    classifier = LocalClassifier(path=args.model)
+    total = answered = agreed = agreed_when_answered = 0
+    local_time = saved = llm_time = 0.0
+    for row in rows:
+        weight = row.get("count", 1)
+        started = time.perf_counter()
+        categories, confidence = classifier.predict(row["query"])
+        local_time += (time.perf_counter() - started) * weight
+        llm_time += row["llm_latency"] * weight
+        match = set(categories) == set(row["labels"])
+        total += weight
+        agreed += match * weight
+        if confidence >= args.threshold:
+            answered += weight
+            agreed_when_answered += match * weight
+            saved += row["llm_latency"] * weight
+    if not total:
+        print("No rows to evaluate")
+        return
+    print(json.dumps({
+        "model": args.model if classifier.trained else "rules-only",
+        "threshold": args.threshold,
+        "queries": total,
+        "agreement_all": round(agreed / total, 4),
+        "coverage": round(answered / total, 4),
+        "agreement_when_local": round(agreed_when_answered / answered, 4) if answered else None,
+        "avg_local_latency_ms": round(local_time / total * 1000, 4),
+        "avg_llm_latency_ms": round(llm_time / total * 1000, 2),
+        "llm_time_saved_pct": round(saved / llm_time * 100, 2) if llm_time else 0.0,
+    }, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and evaluate the local query classifier")
+    parser.add_argument("command", choices=["label", "train", "evaluate"])
+    parser.add_argument("--dataset", default="data/classification_labels.jsonl")
+    parser.add_argument("--model", default=LOCAL_CLASSIFIER_PATH)
+    parser.add_argument("--limit", type=int, default=5000, help="distinct queries to label from query_logs")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of queries held out for evaluation")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.85")))
+    args = parser.parse_args(argv)
+    if args.command == "label":
+        asyncio.run(_label(args))
+    elif args.command == "train":
+        _train(args)
+    else:
+        _evaluate(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import bisect
+import select
+import logging
+import threading
+from datetime import date
+from typing import Dict, List
+import psycopg2
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from models.models import Offer
+from database import SessionLocal
+from cache import normalize_query
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OFFERS_CACHE_REFRESH_SECONDS = float(os.getenv("OFFERS_CACHE_REFRESH_SECONDS", "900"))
+OFFERS_CHANNEL = os.getenv("OFFERS_CHANNEL", "offers_changed")
+
+
+# Pydantic schema for Offer
+class OfferSchema(BaseModel):
+    id: int
+    product_name: str
+    promo_interest_rate: str | None = None
+    signup_bonus: str | None = None
+    valid_till: date
+
+    class Config:
+        from_attributes = True
+
+
+class OffersCache:
+    """
+    Offers that have not expired, serialized once and kept sorted by
+    valid_till so expired ones are dropped from the front as the date moves
+    on. Reloaded after invalidate(), on the NOTIFY the offers trigger sends,
+    or every OFFERS_CACHE_REFRESH_SECONDS as a safety net.
+    """
+
+    def __init__(self):
+        self.dsn = os.getenv("DATABASE_URL", "").replace("postgresql+psycopg2://", "postgresql://")
+        self.version = 0
+        self.loaded_at = None
+        self.loads = 0
+        self.expired = 0
+        self._offers = None
+        self._expiry = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self, db: Session):
+        rows = (
+            db.query(Offer)
+            .filter(Offer.valid_till >= date.today())
+            .order_by(Offer.valid_till, Offer.id)
+            .all()
+        )
+        self._offers = [OfferSchema.model_validate(offer).model_dump() for offer in rows]
+        self._expiry = [offer["valid_till"] for offer in self._offers]
+        self.loaded_at = time.time()
+        self.loads += 1
+        logger.info(f"Loaded {len(self._offers)} live offers")
+
+    def offers(self, db: Session = None) -> List[Dict]:
+        with self._lock:
+            if self._offers is None or time.time() - self.loaded_at > OFFERS_CACHE_REFRESH_SECONDS:
+                if db is not None:
+                    self._load(db)
+                else:
+                    session = SessionLocal()
+                    try:
+                        self._load(session)
+                    finally:
+                        session.close()
+            # An offer is valid through its valid_till date
+            cut = bisect.bisect_left(self._expiry, date.today())
+            if cut:
+                del self._offers[:cut]
+                del self._expiry[:cut]
+                self.expired += cut
+                self.version += 1
+            return list(self._offers)
+
+    def invalidate(self):
+        with self._lock:
+            self._offers = None
+            self._expiry = []
+            self.version += 1
+
+    # --- Write notifications ---
+
+    def start(self):
+        if self._thread is None and self.dsn:
+            self._thread = threading.Thread(target=self._listen_loop, name="offers-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen_loop(self):
+        listener = None
+        while not self._stop.is_set():
+            try:
+                if listener is None:
+                    listener = psycopg2.connect(self.dsn)
+                    listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                    with listener.cursor() as cursor:
+                        cursor.execute(f"LISTEN {OFFERS_CHANNEL}")
+                ready, _, _ = select.select([listener], [], [], 5)
+                if ready:
+                    listener.poll()
+                    listener.notifies.clear()
+                    logger.info("Offers changed, invalidating offers cache")
+                    self.invalidate()
+            except Exception as e:
+                logger.warning(f"Offers change listener failed: {str(e)}")
+                if listener is not None:
+                    listener.close()
+                    listener = None
+                self._stop.wait(30)
+        if listener is not None:
+            listener.close()
+
+    def stats(self) -> Dict:
+        return {
+            "live_offers": len(self._offers) if self._offers is not None else None,
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "loads": self.loads,
+            "expired": self.expired,
+            "version": self.version,
+        }
+
+
+def _phrase_in(phrase: str, text: str) -> bool:
+    return bool(phrase) and re.search(rf"(?<!\w){re.escape(phrase)}(?!\w)", text) is not None
+
+
+def select_offers(offers: List[Dict], query: str, sql_rows=None) -> List[Dict]:
+    """
+    Offers for the products named in the query or returned by the SQL agent.
+    A query that names no offered product (e.g. "any offers right now?")
+    gets every live offer.
+    """
+    text = normalize_query(query)
+    mentioned = set()
+    for row in sql_rows if isinstance(sql_rows, list) else []:
+        values = row.values() if isinstance(row, dict) else row
+        mentioned.update(normalize_query(v) for v in values if isinstance(v, str))
+    matched = []
+    for offer in offers:
+        name = normalize_query(offer["product_name"])
+        if name in mentioned or _phrase_in(name, text):
+            matched.append(offer)
+    return matched or offers
+
+
+offers_cache = OffersCache()
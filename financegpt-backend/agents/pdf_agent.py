@@ -7,82 +7,95 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
+if OPENAI_API_KEY:
+    os.environ['OPENAI_API_KEY'] = OPENAI_API_KEY
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain_openai import ChatOpenAI
 from typing import List, Dict
-from chromadb.config import Settings
+import metrics
+from cache import LRUTTLCache, normalize_query
+from agents.ingest import open_store, sync_index
+from agents.embeddings import get_provider
+from agents.chunking import assemble_context
+from agents.lexical_index import BM25Index, reciprocal_rank_fusion
+
+PDF_QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("PDF_QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+PDF_RETRIEVAL_K = int(os.getenv("PDF_RETRIEVAL_K", "4"))
+PDF_CONTEXT_MAX_TOKENS = int(os.getenv("PDF_CONTEXT_MAX_TOKENS", "512"))
+# auto: lexical-only for short keyword queries, hybrid otherwise
+PDF_RETRIEVAL_MODE = os.getenv("PDF_RETRIEVAL_MODE", "auto")
+PDF_INGEST_ON_STARTUP = os.getenv("PDF_INGEST_ON_STARTUP", "true").lower() == "true"
 
 class PDFAgent:
     def __init__(self, pdf_directory: str = "brochures"):
         logger.info(f"Initializing PDFAgent with directory: {pdf_directory}")
         self.pdf_directory = pdf_directory
-        self.embeddings = OpenAIEmbeddings()
+        self.embeddings = get_provider()
+        # Repeated questions skip the embedding API call entirely
+        self.query_embedding_cache = LRUTTLCache(maxsize=PDF_QUERY_EMBEDDING_CACHE_SIZE)
+        metrics.register("query_embedding_cache", self.query_embedding_cache.stats)
         self.db = None
+        self.ingest_report = None
+        self.lexical_index = BM25Index()
+        self.retrievals = {"vector": 0, "lexical": 0, "hybrid": 0}
+        metrics.register("pdf_retrieval", self.stats)
+        metrics.register("embeddings", self.embeddings.stats)
         self.initialize_db()
 
-    def load_pdfs(self) -> List[str]:
-        logger.info("Loading PDF documents")
-        documents = []
-        for file in os.listdir(self.pdf_directory):
-            if file.endswith('.pdf'):
-                pdf_path = os.path.join(self.pdf_directory, file)
-                logger.info(f"Processing PDF file: {pdf_path}")
-                loader = PyPDFLoader(pdf_path, mode="page")
-                documents.extend(loader.load())
-        logger.info(f"Loaded {len(documents)} documents (pages)")
-        return documents
-
     def initialize_db(self):
         logger.info("Initializing database")
-        client_settings = Settings(anonymized_telemetry=False)
-        if os.path.exists("./chroma_db"):
-            logger.info("Loading existing Chroma database")
-            self.db = Chroma(
-                embedding_function=self.embeddings,
-                persist_directory="./chroma_db",
-                client_settings=client_settings
-            )
+        self.db = open_store(self.embeddings)
+        if PDF_INGEST_ON_STARTUP:
+            # Only new or changed brochure pages are embedded; see agents/ingest.py
+            self.ingest_report = sync_index(self.db, self.pdf_directory, self.embeddings.collection_name)
+        self.refresh_lexical_index()
+
+    def refresh_lexical_index(self):
+        self.lexical_index = BM25Index.from_store(self.db)
+
+    def embed_query(self, query: str) -> List[float]:
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+            self.query_embedding_cache.set(key, embedding)
+        return embedding
+
+    def retrieve(self, query: str, k: int, mode: str = None):
+        mode = mode or PDF_RETRIEVAL_MODE
+        if mode == "auto":
+            mode = "lexical" if self.lexical_index.is_keyword_query(query) else "hybrid"
+        if mode == "hybrid" and not len(self.lexical_index):
+            mode = "vector"
+        if mode == "lexical":
+            documents = [doc for doc, _ in self.lexical_index.search(query, k)]
+        elif mode == "vector":
+            documents = self.db.similarity_search_by_vector(self.embed_query(query), k=k)
         else:
-            logger.info("Creating new Chroma database")
-            documents = self.load_pdfs()
-            logger.info(f"Using {len(documents)} page documents as chunks")
-            self.db = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                persist_directory="./chroma_db",
-                client_settings=client_settings
-            )
+            candidates = 2 * k
+            vector = self.db.similarity_search_by_vector(self.embed_query(query), k=candidates)
+            lexical = [doc for doc, _ in self.lexical_index.search(query, candidates)]
+            documents = reciprocal_rank_fusion([vector, lexical], k)
+        self.retrievals[mode] += 1
+        return documents, mode
+
+    def stats(self) -> Dict:
+        return {"indexed_chunks": len(self.lexical_index), **self.retrievals}
 
-    def query_documents(self, query: str, k: int = 2) -> Dict:
+    def query_documents(self, query: str, k: int = PDF_RETRIEVAL_K) -> Dict:
         logger.info(f"Querying documents with: {query}")
         if not self.db:
             logger.error("Database not initialized")
             raise ValueError("Database not initialized")
 
-        retriever = self.db.as_retriever(search_kwargs={"k": k})
-        llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
-        
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True
-        )
-        
-        logger.info("Executing query chain")
-        response = qa_chain.invoke({"query": query})
-        logger.info("Query completed successfully")
+        # Retrieval only: the brochure text goes straight into the final prompt,
+        # so there is no answer to generate here.
+        documents, mode = self.retrieve(query, k)
+        logger.info(f"Query completed successfully ({mode} retrieval)")
         # Log the metadata of each fetched chunk
-        for i, doc in enumerate(response['source_documents']):
+        for i, doc in enumerate(documents):
             logger.info(f"Fetched chunk {i+1}: metadata={doc.metadata}")
         return {
-            "answer": response['result'],
-            "source_documents": [doc.page_content for doc in response['source_documents']]
+            "source_documents": assemble_context(documents, PDF_CONTEXT_MAX_TOKENS)
         }
 
     def process_query(self, user_query: str) -> str:
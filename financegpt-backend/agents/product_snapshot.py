@@ -0,0 +1,429 @@
+import os
+import re
+import sys
+import json
+import time
+import select
+import sqlite3
+import logging
+import argparse
+import threading
+from decimal import Decimal
+from typing import List
+import psycopg2
+from cache import content_hash
+from agents.sql_templates import TEMPLATES, template_params
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_SNAPSHOT_ENABLED = os.getenv("PRODUCT_SNAPSHOT_ENABLED", "true").lower() == "true"
+PRODUCT_SNAPSHOT_REFRESH_SECONDS = float(os.getenv("PRODUCT_SNAPSHOT_REFRESH_SECONDS", "300"))
+PRODUCT_SNAPSHOT_CHANNEL = os.getenv("PRODUCT_SNAPSHOT_CHANNEL", "financial_products_changed")
+
+# Postgres constructs SQLite would reject or, worse, evaluate differently
+# (plain LIKE is case-sensitive in Postgres but not in SQLite). Queries using
+# them are sent to Postgres instead.
+_UNSUPPORTED = re.compile(
+    r"::|\blike\b|\bsimilar\s+to\b|~|\bdistinct\s+on\b|\binterval\b|\bnow\s*\(|\bcurrent_date\b|"
+    r"\bilike\s+(any|all)\b|\bregexp_|\bto_char\b|\bextract\b|\bdate_trunc\b|\bstring_agg\b|\barray_agg\b|\bfilter\s*\(",
+    re.IGNORECASE,
+)
+_PARAM = re.compile(r"\$(\d+)(::\w+)?")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+# Each ORDER BY clause, up to whatever ends it (a LIMIT, a closing subquery paren or the end)
+_ORDER_BY = re.compile(r"\border\s+by\b(.*?)(?=\blimit\b|\boffset\b|\bfetch\b|\)|;|$)", re.IGNORECASE | re.DOTALL)
+
+
+class SnapshotUnsupported(Exception):
+    pass
+
+
+class ResultRows(list):
+    """Query result rows (tuples) that also carry the result's column names."""
+
+    def __init__(self, rows=(), columns=()):
+        super().__init__(rows)
+        self.columns = list(columns)
+
+
+def _decimal_converter(scale: int):
+    quantum = Decimal(1).scaleb(-scale)
+    return lambda value: Decimal(value.decode()).quantize(quantum)
+
+
+class ProductSnapshot:
+    """
+    In-process SQLite copy of a small Postgres table. Read-only queries the SQL
+    agent produces run against it locally; the copy is rebuilt on a timer or
+    when Postgres sends a NOTIFY on PRODUCT_SNAPSHOT_CHANNEL.
+    """
+
+    def __init__(self, pool, table_name: str, timeout_ms: int = 5000):
+        self.pool = pool
+        self.table_name = table_name
+        # Same deadline Postgres enforces with statement_timeout
+        self.timeout_ms = timeout_ms
+        self.dsn = pool.dsn
+        self.version = None
+        # Columns whose ORDER BY can come out differently in SQLite: nullable ones
+        # (NULLs sort first there, last in Postgres) and, unless Postgres collates
+        # with C/POSIX, text ones
+        self.order_sensitive = set()
+        self.loaded_at = None
+        self.local_queries = 0
+        self.unsupported = 0
+        self.timeouts = 0
+        self.refreshes = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh()
+
+    def _fetch(self):
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SELECT * FROM {self.table_name} ORDER BY 1")
+                    rows = cursor.fetchall()
+                    columns = [(column.name, column.type_code, column.scale) for column in cursor.description]
+            finally:
+                conn.rollback()
+        return columns, rows
+
+    def _ordering(self) -> set:
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT datcollate FROM pg_database WHERE datname = current_database()")
+                    byte_order = cursor.fetchone()[0] in ("C", "POSIX")
+                    cursor.execute(
+                        "SELECT column_name, is_nullable, data_type FROM information_schema.columns WHERE table_name = %s",
+                        (self.table_name,),
+                    )
+                    columns = cursor.fetchall()
+            finally:
+                conn.rollback()
+        return {
+            name.lower() for name, nullable, data_type in columns
+            if nullable == "YES" or (not byte_order and data_type in ("character varying", "character", "text"))
+        }
+
+    def _build(self, columns, rows) -> sqlite3.Connection:
+        definitions = []
+        for name, type_code, scale in columns:
+            if type_code in psycopg2.extensions.DECIMAL.values:
+                if scale:
+                    # NUMERIC(p, s) round-trips as Decimal with the same scale
+                    sqlite3.register_converter(f"DECIMAL_{scale}", _decimal_converter(scale))
+                    definitions.append(f"{name} DECIMAL_{scale}")
+                else:
+                    definitions.append(f"{name} NUMERIC")
+            elif type_code in psycopg2.extensions.INTEGER.values or type_code in psycopg2.extensions.LONGINTEGER.values:
+                definitions.append(f"{name} INTEGER")
+            elif type_code in psycopg2.extensions.FLOAT.values:
+                definitions.append(f"{name} REAL")
+            else:
+                definitions.append(f"{name} TEXT")
+        db = sqlite3.connect(":memory:", check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        db.execute(f"CREATE TABLE {self.table_name} ({', '.join(definitions)})")
+        placeholders = ", ".join(["?"] * len(columns))
+        db.executemany(
+            f"INSERT INTO {self.table_name} VALUES ({placeholders})",
+            [tuple(str(v) if isinstance(v, Decimal) else v for v in row) for row in rows],
+        )
+        for name, _, _ in columns[1:]:
+            if name in ("type", "risk_level"):
+                db.execute(f"CREATE INDEX idx_{name} ON {self.table_name} ({name})")
+        db.commit()
+        return db
+
+    def refresh(self) -> bool:
+        columns, rows = self._fetch()
+        version = content_hash(json.dumps([c[:1] for c in columns]), repr(rows))
+        if version == self.version:
+            self.loaded_at = time.time()
+            return False
+        db = self._build(columns, rows)
+        order_sensitive = self._ordering()
+        with self._lock:
+            self.order_sensitive = order_sensitive
+            old, self._db = self._db, db
+            self.version = version
+            self.loaded_at = time.time()
+        if old is not None:
+            old.close()
+        self.refreshes += 1
+        logger.info(f"Loaded {len(rows)} rows of {self.table_name} into the local snapshot (version {version})")
+        return True
+
+    def _run(self, sql: str, params=()) -> List:
+        deadline = time.monotonic() + self.timeout_ms / 1000
+        timed_out = []
+
+        def past_deadline():
+            # SQLite calls this every 1000 VM instructions; non-zero aborts the statement
+            if time.monotonic() > deadline:
+                timed_out.append(True)
+                return 1
+            return 0
+
+        with self._lock:
+            self._db.set_progress_handler(past_deadline, 1000)
+            try:
+                cursor = self._db.execute(sql, params)
+                return ResultRows(cursor.fetchall(), [column[0] for column in cursor.description])
+            except sqlite3.Error as e:
+                if timed_out:
+                    # Postgres would hit the same statement_timeout, so don't retry there
+                    self.timeouts += 1
+                    raise Exception("SQL Error: canceling statement due to statement timeout")
+                self.unsupported += 1
+                raise SnapshotUnsupported(str(e))
+            finally:
+                self._db.set_progress_handler(None, 1000)
+
+    def _divergence(self, sql_query: str):
+        """Why SQLite could return a different result for sql_query than Postgres, if it could."""
+        if _UNSUPPORTED.search(sql_query):
+            return "query uses Postgres-specific syntax"
+        code = _STRING_LITERAL.sub("''", sql_query)
+        if "/" in code:
+            # SQLite divides integers (and whole NUMERICs) as integers
+            return "query divides"
+        return self._order_divergence(code)
+
+    def _order_divergence(self, code: str):
+        for clause in _ORDER_BY.findall(code):
+            terms = set(re.findall(r"\w+", clause.lower()))
+            if terms & self.order_sensitive or any(term.isdigit() for term in terms):
+                return "query orders by a column SQLite sorts differently"
+        return None
+
+    def query(self, sql_query: str, max_rows: int) -> List:
+        reason = self._divergence(sql_query)
+        if reason:
+            self.unsupported += 1
+            raise SnapshotUnsupported(reason)
+        local_sql = re.sub(r"\bilike\b", "LIKE", sql_query, flags=re.IGNORECASE)
+        rows = self._run(f"SELECT * FROM ({local_sql}) AS sql_agent_result LIMIT {int(max_rows)}")
+        self.local_queries += 1
+        return rows
+
+    def query_template(self, template_sql: str, params: tuple) -> List:
+        # Templates are written for both engines (their casts are stripped below),
+        # so only their ORDER BY can make the two disagree
+        reason = self._order_divergence(template_sql)
+        if reason:
+            self.unsupported += 1
+            raise SnapshotUnsupported(reason)
+        local_sql = _PARAM.sub(lambda m: f":p{m.group(1)}", template_sql)
+        named = {f"p{i}": float(v) if isinstance(v, Decimal) else v for i, v in enumerate(params, start=1)}
+        rows = self._run(local_sql, named)
+        self.local_queries += 1
+        return rows
+
+    def _postgres(self, sql: str, max_rows: int) -> List:
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SELECT * FROM ({sql}) AS sql_agent_result LIMIT {int(max_rows)}")
+                    return cursor.fetchall()
+            finally:
+                conn.rollback()
+
+    def _postgres_template(self, template_sql: str, params: tuple) -> List:
+        # psycopg2 takes positional %s, so a $n used twice is passed twice
+        values = []
+
+        def placeholder(match):
+            values.append(params[int(match.group(1)) - 1])
+            return "%s" + (match.group(2) or "")
+
+        sql = _PARAM.sub(placeholder, template_sql)
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, values)
+                    return cursor.fetchall()
+            finally:
+                conn.rollback()
+
+    def verify(self, queries: List[str] = None) -> dict:
+        """Compare the snapshot with the live table, and each query's result on both engines."""
+        columns, rows = self._fetch()
+        live_version = content_hash(json.dumps([c[:1] for c in columns]), repr(rows))
+        with self._lock:
+            local_rows = self._db.execute(f"SELECT * FROM {self.table_name} ORDER BY 1").fetchall()
+        parity = []
+        for sql in PARITY_QUERIES if queries is None else queries:
+            expected = self._postgres(sql, 200)
+            try:
+                same = same_rows(self.query(sql, 200), expected)
+                parity.append({"query": sql, "engine": "snapshot", "same_result": same})
+            except SnapshotUnsupported as e:
+                parity.append({"query": sql, "engine": "postgres", "reason": str(e), "same_result": True})
+        for name, slots in TEMPLATE_PARITY:
+            params = template_params(slots) + (200,)
+            case = f"template {name} {slots}"
+            expected = self._postgres_template(TEMPLATES[name]["sql"], params)
+            try:
+                same = same_rows(self.query_template(TEMPLATES[name]["sql"], params), expected)
+                parity.append({"query": case, "engine": "snapshot", "same_result": same})
+            except SnapshotUnsupported as e:
+                parity.append({"query": case, "engine": "postgres", "reason": str(e), "same_result": True})
+        table_consistent = live_version == self.version and [tuple(r) for r in rows] == local_rows
+        return {
+            "consistent": table_consistent and all(p["same_result"] for p in parity),
+            "table_consistent": table_consistent,
+            "live_rows": len(rows),
+            "snapshot_rows": len(local_rows),
+            "live_version": live_version,
+            "snapshot_version": self.version,
+            "queries": parity,
+        }
+
+    # --- Background refresh ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="product-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {PRODUCT_SNAPSHOT_CHANNEL}")
+        return conn
+
+    def _refresh_loop(self):
+        listener = None
+        while not self._stop.is_set():
+            try:
+                if listener is None:
+                    listener = self._listen()
+                ready, _, _ = select.select([listener], [], [], PRODUCT_SNAPSHOT_REFRESH_SECONDS)
+                if ready:
+                    listener.poll()
+                    listener.notifies.clear()
+                    # Let a burst of writes settle before reloading
+                    time.sleep(0.5)
+                if not self._stop.is_set():
+                    self.refresh()
+            except Exception as e:
+                logger.warning(f"Product snapshot refresh failed: {str(e)}")
+                if listener is not None:
+                    listener.close()
+                    listener = None
+                self._stop.wait(min(PRODUCT_SNAPSHOT_REFRESH_SECONDS, 30))
+        if listener is not None:
+            listener.close()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "refreshes": self.refreshes,
+            "local_queries": self.local_queries,
+            "unsupported": self.unsupported,
+            "timeouts": self.timeouts,
+        }
+
+
+# --- Consistency check and benchmark ---
+
+def _comparable(value):
+    # SQLite hands back floats and ints where psycopg2 gives Decimal
+    if isinstance(value, (Decimal, float)):
+        return round(float(value), 6)
+    return value
+
+
+def same_rows(local: List, remote: List) -> bool:
+    return [tuple(_comparable(v) for v in row) for row in local] == [tuple(_comparable(v) for v in row) for row in remote]
+
+
+BENCH_QUERIES = [
+    "SELECT name, interest_rate FROM financial_products WHERE type = 'Fixed Deposit' ORDER BY name",
+    "SELECT type, COUNT(*) FROM financial_products GROUP BY type ORDER BY type",
+    "SELECT name, min_amount FROM financial_products WHERE risk_level = 'Low' AND min_amount <= 5000 ORDER BY min_amount, name",
+    "SELECT name FROM financial_products WHERE name ILIKE '%card%' ORDER BY name",
+    "SELECT * FROM financial_products WHERE tenure_months >= 36 ORDER BY id",
+]
+# Queries the snapshot has answered differently from Postgres in the past; verify
+# checks they are either sent to Postgres or give the same rows locally
+PARITY_QUERIES = BENCH_QUERIES + [
+    "SELECT name, min_amount / 12 AS monthly FROM financial_products WHERE type = 'Fixed Deposit' ORDER BY id",
+    "SELECT name, tenure_months FROM financial_products ORDER BY tenure_months DESC LIMIT 5",
+    "SELECT name FROM financial_products ORDER BY 1 LIMIT 5",
+    "SELECT type, AVG(min_amount) FROM financial_products GROUP BY type ORDER BY type",
+]
+# Template slots (unset ones are NULL) checked the same way
+TEMPLATE_PARITY = [
+    ("product_filter", {"type": "Fixed Deposit"}),
+    ("product_filter", {"max_min_amount": Decimal(5000), "min_tenure": 12}),
+    ("product_filter", {"min_amount_under": Decimal(5000), "tenure_over": 12}),
+    ("product_count", {"risk_level": "Low"}),
+]
+
+
+def _bench(agent, iterations: int):
+    report = []
+    cases = [("sql", sql) for sql in BENCH_QUERIES] + [("template", "product_filter")]
+    for kind, case in cases:
+        if kind == "sql":
+            local = lambda: agent.snapshot.query(case, 200)
+            remote = lambda: agent._retry_on_disconnect(agent._execute_sql, case)
+        else:
+            params = template_params({"type": "Fixed Deposit"}) + (200,)
+            local = lambda: agent.snapshot.query_template(TEMPLATES[case]["sql"], params)
+            remote = lambda: agent._retry_on_disconnect(agent._execute_template, case, params[:-1])
+        if kind == "sql":
+            reason = agent.snapshot._divergence(case)
+            if reason:
+                report.append({"query": case, "engine": "postgres", "reason": reason})
+                continue
+        timings = {}
+        for label, fn in (("local", local), ("postgres", remote)):
+            fn()
+            started = time.perf_counter()
+            for _ in range(iterations):
+                result = fn()
+            timings[label] = (time.perf_counter() - started) / iterations * 1000
+            timings[f"{label}_rows"] = result
+        report.append({
+            "query": case,
+            "local_ms": round(timings["local"], 4),
+            "postgres_ms": round(timings["postgres"], 4),
+            "speedup": round(timings["postgres"] / timings["local"], 1) if timings["local"] else None,
+            "same_result": same_rows(timings["local_rows"], timings["postgres_rows"]),
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and benchmark the local financial_products snapshot")
+    parser.add_argument("command", choices=["verify", "bench"])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args(argv)
+    from agents.sql_agent import SQLAgent
+    agent = SQLAgent(table_name="financial_products")
+    if agent.snapshot is None:
+        print("PRODUCT_SNAPSHOT_ENABLED is false")
+        return
+    if args.command == "verify":
+        print(json.dumps(agent.snapshot.verify(), indent=2))
+    else:
+        print(json.dumps(_bench(agent, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
@@ -1,6 +1,20 @@
 import os
+import re
+import json
+import time
+import uuid
+import logging
+from contextlib import contextmanager
 import psycopg2
-from openai import OpenAI
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+import llm
+import metrics
+import tracing
+from database import get_engine
+from stages import stages
+from cache import LRUTTLCache, normalize_query, content_hash
+from agents.sql_templates import TEMPLATES, match_template, template_params
+from agents.product_snapshot import ProductSnapshot, SnapshotUnsupported, ResultRows, PRODUCT_SNAPSHOT_ENABLED
 from typing import Dict, List
 from prompts.sql_agent import SQL_GENERATION_PROMPT
 
@@ -8,40 +22,279 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "2048"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "86400"))
+SQL_SCHEMA_CHECK_INTERVAL = float(os.getenv("SQL_SCHEMA_CHECK_INTERVAL", "300"))
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "5000"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "200"))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "100"))
+
+_FORBIDDEN_SQL = re.compile(
+    r"\b(insert|update|delete|merge|drop|alter|create|truncate|grant|revoke|copy|vacuum|analyze|call|"
+    r"into|lock|listen|notify|set|reset|pg_sleep|pg_read_file|pg_terminate_backend|dblink)\b",
+    re.IGNORECASE,
+)
+
+
+def validate_sql(sql_query: str, table_name: str) -> str:
+    """Return the cleaned statement if it is a single read-only query on table_name."""
+    sql = sql_query.strip()
+    sql = re.sub(r"^```(?:sql)?\s*|\s*```$", "", sql, flags=re.IGNORECASE).strip()
+    sql = sql.rstrip(";").strip()
+    if not sql:
+        raise ValueError("Empty SQL query")
+    if ";" in sql:
+        raise ValueError("Multiple SQL statements are not allowed")
+    if not re.match(r"^(select|with)\b", sql, re.IGNORECASE):
+        raise ValueError("Only SELECT queries are allowed")
+    if _FORBIDDEN_SQL.search(sql):
+        raise ValueError("SQL query contains a forbidden keyword")
+    if not re.search(rf"\b{re.escape(table_name)}\b", sql, re.IGNORECASE):
+        raise ValueError(f"SQL query must read from {table_name}")
+    return sql
+
+
+class ConnectionPool:
+    """
+    Raw psycopg2 connections borrowed from the process-wide SQLAlchemy pool
+    (database.get_engine), which handles sizing, checkout timeouts, pre-ping
+    and recycling. Broken connections are invalidated rather than returned.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dsn = os.getenv("DATABASE_URL", "").replace("postgresql+psycopg2://", "postgresql://")
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.engine.raw_connection()
+        except PoolTimeout:
+            raise Exception("Timed out waiting for a database connection")
+        try:
+            yield conn
+        finally:
+            if conn.dbapi_connection is not None and conn.dbapi_connection.closed:
+                conn.invalidate()
+            conn.close()
+
+    @staticmethod
+    def prepared(conn) -> set:
+        # Statements PREPAREd on this session; forgotten when the pool replaces it
+        return conn.info.setdefault("prepared", set())
+
 
 class SQLAgent:
     def __init__(self, table_name: str):
-        self.conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        self.cursor = self.conn.cursor()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.table_name = table_name
+        self.pool = ConnectionPool(get_engine())
+        # Generated SQL is cached per normalized query; keys carry a hash of the
+        # generation prompt and the live table schema so either change misses.
+        self.sql_cache = LRUTTLCache(maxsize=SQL_CACHE_SIZE, ttl=SQL_CACHE_TTL)
+        self.schema_version = self.load_schema_version()
+        self.schema_checked_at = time.monotonic()
+        self.generations = 0
+        self.generation_time = 0.0
+        self.template_hits = 0
+        metrics.register("sql_cache", self.cache_stats)
+        # Product questions are answered from an in-process copy of the table when possible
+        self.snapshot = None
+        if PRODUCT_SNAPSHOT_ENABLED:
+            try:
+                self.snapshot = ProductSnapshot(self.pool, table_name, timeout_ms=SQL_STATEMENT_TIMEOUT_MS)
+                self.snapshot.start()
+                metrics.register("product_snapshot", self.snapshot.stats)
+            except Exception as e:
+                logger.warning(f"Product snapshot disabled, querying Postgres directly: {str(e)}")
 
-    def execute_sql(self, sql_query: str) -> List:
+    def load_schema_version(self) -> str:
+        with self.pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT column_name, data_type, is_nullable FROM information_schema.columns "
+                        "WHERE table_name = %s ORDER BY ordinal_position",
+                        (self.table_name,)
+                    )
+                    columns = cursor.fetchall()
+            finally:
+                conn.rollback()
+        return content_hash(SQL_GENERATION_PROMPT, json.dumps(columns))
+
+    async def refresh_schema_version(self):
+        if time.monotonic() - self.schema_checked_at < SQL_SCHEMA_CHECK_INTERVAL:
+            return
+        self.schema_checked_at = time.monotonic()
+        schema_version = await stages["sql"].execute(self.load_schema_version)
+        if schema_version != self.schema_version:
+            logger.info(f"Schema of {self.table_name} changed; dropping cached SQL")
+            self.schema_version = schema_version
+            self.sql_cache.invalidate()
+
+    def cache_key(self, natural_language_query: str) -> str:
+        return f"{self.schema_version}:{normalize_query(natural_language_query)}"
+
+    def cache_stats(self) -> dict:
+        stats = self.sql_cache.stats()
+        avg_generation = self.generation_time / self.generations if self.generations else 0.0
+        stats["avg_generation_time"] = round(avg_generation, 4)
+        stats["template_hits"] = self.template_hits
+        stats["estimated_time_saved"] = round((stats["hits"] + self.template_hits) * avg_generation, 3)
+        return stats
+
+    def _begin_read_only(self, conn):
+        # Transaction-scoped settings: they reset on rollback, so the
+        # connection goes back to the pool unchanged.
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute("SET LOCAL statement_timeout = %s", (SQL_STATEMENT_TIMEOUT_MS,))
+
+    def _retry_on_disconnect(self, fn, *args):
+        # Reads are idempotent, so a dropped connection gets one retry on a fresh one
         try:
-            self.cursor.execute(sql_query)
-            return self.cursor.fetchall()
-        except Exception as e:
-            raise Exception(f"SQL Error: {str(e)}")
+            return fn(*args)
+        except psycopg2.Error as e:
+            logger.warning(f"Database connection lost, retrying: {str(e)}")
+            try:
+                return fn(*args)
+            except psycopg2.Error as e:
+                raise Exception(f"SQL Error: {str(e)}")
+
+    def execute_sql(self, sql_query: str) -> List:
+        if self.snapshot:
+            try:
+                return self.snapshot.query(sql_query, SQL_MAX_ROWS)
+            except SnapshotUnsupported as e:
+                logger.info(f"Running SQL on Postgres, snapshot cannot: {str(e)}")
+        return self._retry_on_disconnect(self._execute_sql, sql_query)
+
+    def execute_template(self, name: str, params: tuple) -> List:
+        if self.snapshot:
+            try:
+                return self.snapshot.query_template(TEMPLATES[name]["sql"], tuple(params) + (SQL_MAX_ROWS,))
+            except SnapshotUnsupported as e:
+                logger.info(f"Running template on Postgres, snapshot cannot: {str(e)}")
+        return self._retry_on_disconnect(self._execute_template, name, params)
 
-    def generate_sql(self, natural_language_query: str) -> str:
+    def close(self):
+        if self.snapshot:
+            self.snapshot.stop()
+
+    def _execute_sql(self, sql_query: str) -> List:
+        with self.pool.connection() as conn:
+            try:
+                self._begin_read_only(conn)
+                # A server-side cursor streams the result in SQL_FETCH_SIZE batches,
+                # and the wrapping LIMIT caps the rows Postgres produces at all.
+                with conn.cursor(name=f"sql_agent_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = SQL_FETCH_SIZE
+                    cursor.execute(f"SELECT * FROM ({sql_query}) AS sql_agent_result LIMIT {SQL_MAX_ROWS}")
+                    rows = []
+                    while len(rows) < SQL_MAX_ROWS:
+                        batch = cursor.fetchmany(SQL_FETCH_SIZE)
+                        if not batch:
+                            break
+                        rows.extend(batch)
+                    columns = [column.name for column in cursor.description or ()]
+                return ResultRows(rows, columns)
+            except Exception as e:
+                if conn.closed:
+                    raise
+                raise Exception(f"SQL Error: {str(e)}")
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+
+    def _execute_template(self, name: str, params: tuple) -> List:
+        template = TEMPLATES[name]
+        statement = f"fp_{name}"
+        params = tuple(params) + (SQL_MAX_ROWS,)
+        placeholders = ", ".join(["%s"] * len(params))
+        with self.pool.connection() as conn:
+            prepared = self.pool.prepared(conn)
+            try:
+                for attempt in range(2):
+                    try:
+                        self._begin_read_only(conn)
+                        with conn.cursor() as cursor:
+                            if statement not in prepared:
+                                cursor.execute(f"PREPARE {statement}({template['param_types']}) AS {template['sql']}")
+                                prepared.add(statement)
+                            cursor.execute(f"EXECUTE {statement}({placeholders})", params)
+                            return ResultRows(cursor.fetchall(), [column.name for column in cursor.description])
+                    except psycopg2.errors.InvalidSqlStatementName:
+                        # The session lost its prepared statement; prepare again
+                        conn.rollback()
+                        prepared.discard(statement)
+                        if attempt:
+                            raise
+                    except psycopg2.errors.DuplicatePreparedStatement:
+                        # Prepared on this session but not tracked; just EXECUTE it
+                        conn.rollback()
+                        prepared.add(statement)
+                        if attempt:
+                            raise
+            except Exception as e:
+                if conn.closed:
+                    raise
+                raise Exception(f"SQL Error: {str(e)}")
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+
+    async def generate_sql(self, natural_language_query: str) -> str:
+        await self.refresh_schema_version()
+        key = self.cache_key(natural_language_query)
+        cached = self.sql_cache.get(key)
+        if cached is not None:
+            try:
+                sql_query = validate_sql(cached, self.table_name)
+                avg_generation = self.generation_time / self.generations if self.generations else 0.0
+                logger.info(f"SQL cache hit for '{natural_language_query}' (saved ~{avg_generation * 1000:.0f} ms)")
+                return sql_query
+            except ValueError as e:
+                logger.warning(f"Dropping cached SQL that failed validation: {str(e)}")
+                self.sql_cache.invalidate(key)
         prompt = SQL_GENERATION_PROMPT.format(query=natural_language_query)
-        
-        response = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        return response.choices[0].message.content
-
-    def process_query(self, natural_language_query: str) -> Dict:
+        started = time.perf_counter()
+        sql_query = validate_sql(await llm.complete(prompt, temperature=0), self.table_name)
+        self.generation_time += time.perf_counter() - started
+        self.generations += 1
+        self.sql_cache.set(key, sql_query)
+        return sql_query
+
+    async def process_query(self, natural_language_query: str) -> Dict:
         try:
+            # Common question shapes run as prepared, parameterized templates
+            template = match_template(natural_language_query)
+            if template:
+                name, slots = template
+                logger.info(f"SQL template '{name}' matched with slots {slots}")
+                with tracing.span("sql_execution"):
+                    result = await stages["sql"].execute(self.execute_template, name, template_params(slots))
+                self.template_hits += 1
+                return {
+                    "status": "success",
+                    "result": result,
+                }
+
             # Generate SQL from natural language
-            sql_query = self.generate_sql(natural_language_query)
+            with tracing.span("sql_generation"):
+                sql_query = await self.generate_sql(natural_language_query)
+
+            logger.info(f"Generated SQL: {sql_query}")
+
+            # Execute the SQL query on the sql stage's thread pool
+            try:
+                with tracing.span("sql_execution"):
+                    result = await stages["sql"].execute(self.execute_sql, sql_query)
+            except Exception:
+                # Never keep serving SQL that the database rejects
+                self.sql_cache.invalidate(self.cache_key(natural_language_query))
+                raise
 
-            print(sql_query)
-            
-            # Execute the SQL query
-            result = self.execute_sql(sql_query)
-            
             # Generate explanation
             return {
                 "status": "success",
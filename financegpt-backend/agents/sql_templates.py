@@ -0,0 +1,115 @@
+import re
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+# Parameterized statements for the common product question shapes. Each is
+# PREPAREd once per connection and run with EXECUTE, so Postgres can reuse
+# its plan; unset slots are passed as NULL and drop out of the WHERE clause.
+# The final parameter is the row cap.
+_FILTERS = """
+    ($1::text IS NULL OR type = $1)
+    AND ($2::text IS NULL OR risk_level = $2)
+    AND ($3::numeric IS NULL OR min_amount <= $3)
+    AND ($4::numeric IS NULL OR min_amount < $4)
+    AND ($5::int IS NULL OR tenure_months >= $5)
+    AND ($6::int IS NULL OR tenure_months > $6)
+"""
+
+TEMPLATES = {
+    "product_filter": {
+        "param_types": "text, text, numeric, numeric, int, int, int",
+        "sql": (
+            "SELECT name, type, interest_rate, min_amount, risk_level, tenure_months, eligibility "
+            f"FROM financial_products WHERE {_FILTERS} ORDER BY type, min_amount, name LIMIT $7"
+        ),
+    },
+    "product_count": {
+        "param_types": "text, text, numeric, numeric, int, int, int",
+        "sql": (
+            "SELECT type, COUNT(*) AS product_count "
+            f"FROM financial_products WHERE {_FILTERS} GROUP BY type ORDER BY type LIMIT $7"
+        ),
+    },
+}
+
+# "up to" and "at least" bounds are inclusive, "under" and "over" strict
+SLOT_ORDER = ["type", "risk_level", "max_min_amount", "min_amount_under", "min_tenure", "tenure_over"]
+
+_PRODUCT_TYPES = [
+    ("Fixed Deposit", re.compile(r"\b(fixed|term)[ -]deposits?\b|\bfds?\b")),
+    ("Mutual Fund", re.compile(r"\bmutual[ -]funds?\b|\bmfs?\b|\bsips?\b")),
+    ("Insurance", re.compile(r"\binsurance( plans?| polic(y|ies))?\b|\bpolic(y|ies)\b")),
+    ("Credit Card", re.compile(r"\bcredit[ -]cards?\b|\bcards?\b")),
+]
+_RISK = re.compile(r"\b(low|medium|moderate|high)[ -]risk\b|\brisk(?: level)?(?: is| of)? (low|medium|moderate|high)\b")
+_AMOUNT = re.compile(
+    r"\b(?:(under|below|less than)|upto|up to|within|at most|not more than|max(?:imum)?(?: of)?)\s*"
+    r"(?:₹|rs\.?|inr|rupees)?\s*(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|lakhs?|lacs?|l|crores?|cr)?\b"
+    r"(?!\s*(?:months?|years?|yrs?)\b)"
+)
+_TENURE = re.compile(
+    r"\b(?:at least|atleast|minimum(?: of)?|min|(?<!not )(more than|over|longer than))\s*(\d+)\s*(months?|years?|yrs?)\b"
+    r"|\b(\d+)\s*(months?|years?|yrs?)\s*(?:or more|and above|or longer|plus)\b"
+)
+_COUNT = re.compile(r"\bhow many\b|\bcount\b|\bnumber of\b")
+_MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "l": 100_000, "lakh": 100_000, "lakhs": 100_000, "lac": 100_000,
+                "lacs": 100_000, "cr": 10_000_000, "crore": 10_000_000, "crores": 10_000_000}
+
+# Words that may surround the slots without changing what the question asks.
+_FILLER = set("""
+a an the all any list show me give tell what which are is do does you your have has there available
+provide options option products product kind kinds types type of with and or please can i get see find
+for in on to that my our jio finance financial rupees rs inr min amount minimum investment tenure risk level
+""".split())
+
+
+def _amount(number: str, unit: Optional[str]) -> Decimal:
+    value = Decimal(number.replace(",", ""))
+    return value * _MULTIPLIERS.get(unit or "", 1)
+
+
+def match_template(query: str) -> Optional[Tuple[str, Dict]]:
+    """
+    Return (template_name, slots) when the query is fully explained by the
+    template slots, or None so the caller falls back to LLM SQL generation.
+    """
+    text = query.lower()
+    slots = dict.fromkeys(SLOT_ORDER)
+    spans = []
+
+    types = [(name, m) for name, pattern in _PRODUCT_TYPES for m in [pattern.search(text)] if m]
+    if len(types) > 1:
+        return None
+    if types:
+        slots["type"] = types[0][0]
+        spans.append(types[0][1].span())
+    risk = _RISK.search(text)
+    if risk:
+        level = (risk.group(1) or risk.group(2)).replace("moderate", "medium")
+        slots["risk_level"] = level.capitalize()
+        spans.append(risk.span())
+    amount = _AMOUNT.search(text)
+    if amount:
+        slots["min_amount_under" if amount.group(1) else "max_min_amount"] = _amount(amount.group(2), amount.group(3))
+        spans.append(amount.span())
+    tenure = _TENURE.search(text)
+    if tenure:
+        number, unit = (tenure.group(2), tenure.group(3)) if tenure.group(2) else (tenure.group(4), tenure.group(5))
+        slots["tenure_over" if tenure.group(1) else "min_tenure"] = int(number) * (12 if unit.startswith(("year", "yr")) else 1)
+        spans.append(tenure.span())
+    count = _COUNT.search(text)
+    if count:
+        spans.append(count.span())
+
+    if not any(value is not None for value in slots.values()) and not count and not re.search(r"\bproducts?\b", text):
+        return None
+    residual = text
+    for start, end in sorted(spans, reverse=True):
+        residual = residual[:start] + " " + residual[end:]
+    if any(word not in _FILLER for word in re.findall(r"[a-z0-9]+", residual)):
+        return None
+    return ("product_count" if count else "product_filter"), slots
+
+
+def template_params(slots: Dict) -> Tuple:
+    return tuple(slots.get(name) for name in SLOT_ORDER)
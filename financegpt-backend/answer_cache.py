@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import logging
+import threading
+from typing import Dict, FrozenSet, Hashable, List, Optional
+import numpy as np
+import metrics
+from cache import normalize_query
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Semantic cache of finished answers. A first question whose embedding is close
+# enough to an earlier one from the same profile bucket is answered from the
+# cache. Answers are only cached when written from the profile bucket (see
+# prompt_context.shared_profile), so nothing personal is served to another user.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# ada-002 puts questions that differ only in the bank or product they name
+# ("HDFC FD rates" / "SBI FD rates") around 0.95, so the bar sits above that;
+# named entities and numbers must also match exactly (see key_terms)
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.98"))
+ANSWER_CACHE_CHUNK_CHARS = int(os.getenv("ANSWER_CACHE_CHUNK_CHARS", "80"))
+
+_WORDS = re.compile(r"\s*\S+\s*")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9&'-]*")
+
+
+def key_terms(query: str) -> FrozenSet[str]:
+    """
+    Numbers and names in a query: capitalized words that do not start a
+    sentence, and acronyms anywhere. Two queries can only share an answer
+    when these are the same, however close their embeddings are.
+    """
+    terms = {number.replace(",", "") for number in _NUMBER.findall(query)}
+    for match in _WORD.finditer(query):
+        word = match.group()
+        sentence_start = query[:match.start()].rstrip()[-1:] in ("", ".", "?", "!")
+        acronym = len(word) > 1 and sum(c.isupper() for c in word) > 1
+        if acronym or (word[0].isupper() and len(word) > 1 and not sentence_start):
+            terms.add(normalize_query(word))
+    return frozenset(terms)
+
+
+def chunk_answer(answer: str, size: int = ANSWER_CACHE_CHUNK_CHARS) -> List[str]:
+    """Split an answer at word boundaries into chunks of about size characters."""
+    chunks, current = [], ""
+    for word in _WORDS.findall(answer):
+        if current and len(current) + len(word) > size:
+            chunks.append(current)
+            current = ""
+        current += word
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class AnswerCache:
+    """
+    Fixed-capacity matrix of unit query embeddings with the answer for each
+    row. A lookup is one matrix-vector product over the live rows of the
+    caller's bucket. Rows are replaced oldest first once the cache is full,
+    expire after ANSWER_CACHE_TTL seconds, and are all dropped when the data
+    version (product snapshot and offers) passed in by the caller changes.
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = None
+        self._vectors = None
+        self._buckets = np.full(maxsize, -1, dtype=np.int32)  # -1 marks a free row
+        self._expires = np.zeros(maxsize)
+        self._entries: List[Optional[Dict]] = [None] * maxsize
+        self._bucket_ids: Dict[Hashable, int] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.term_mismatches = 0
+        self.similarity_total = 0.0
+
+    @staticmethod
+    def _unit(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _clear(self):
+        self._buckets[:] = -1
+        self._entries = [None] * self.maxsize
+        self._next = 0
+
+    def _sync_version(self, version: Hashable):
+        if version != self.version:
+            if self.version is not None:
+                self.invalidations += 1
+                logger.info(f"Products or offers changed, dropping {int((self._buckets >= 0).sum())} cached answers")
+            self._clear()
+            self.version = version
+
+    def _expire(self, now: float):
+        expired = (self._buckets >= 0) & (self._expires <= now)
+        count = int(expired.sum())
+        if count:
+            self._buckets[expired] = -1
+            for row in np.flatnonzero(expired):
+                self._entries[row] = None
+            self.expired += count
+
+    def lookup(self, vector, bucket: Hashable, version: Hashable, query: str) -> Optional[Dict]:
+        """The cached entry most similar to vector in bucket that passes the threshold and names the same things as query."""
+        unit = self._unit(vector)
+        with self._lock:
+            self._sync_version(version)
+            self._expire(time.time())
+            bucket_id = self._bucket_ids.get(bucket)
+            if unit is None or bucket_id is None or self._vectors is None or self._vectors.shape[1] != unit.shape[0]:
+                self.misses += 1
+                return None
+            rows = np.flatnonzero(self._buckets == bucket_id)
+            if not len(rows):
+                self.misses += 1
+                return None
+            similarities = self._vectors[rows] @ unit
+            terms = key_terms(query)
+            for best in np.argsort(-similarities):
+                similarity = float(similarities[best])
+                if similarity < self.threshold:
+                    break
+                entry = self._entries[rows[best]]
+                if entry["terms"] != terms:
+                    self.term_mismatches += 1
+                    continue
+                self.hits += 1
+                self.similarity_total += similarity
+                return dict(entry, similarity=similarity)
+            self.misses += 1
+            return None
+
+    def store(self, vector, bucket: Hashable, version: Hashable, query: str, answer: str, recommendations: List[str]):
+        unit = self._unit(vector)
+        if unit is None or not answer:
+            return
+        with self._lock:
+            if version != self.version:
+                # The data changed while this answer was being written
+                return
+            if self._vectors is None or self._vectors.shape[1] != unit.shape[0]:
+                self._vectors = np.zeros((self.maxsize, unit.shape[0]), dtype=np.float32)
+                self._clear()
+            row = self._next
+            self._next = (self._next + 1) % self.maxsize
+            if self._buckets[row] >= 0:
+                self.evictions += 1
+            self._vectors[row] = unit
+            self._buckets[row] = self._bucket_ids.setdefault(bucket, len(self._bucket_ids))
+            self._expires[row] = time.time() + self.ttl
+            self._entries[row] = {
+                "query": query,
+                "terms": key_terms(query),
+                "answer": answer,
+                "recommendations": list(recommendations),
+            }
+            self.stores += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "size": int((self._buckets >= 0).sum()),
+            "maxsize": self.maxsize,
+            "buckets": len(self._bucket_ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "similarity_avg": round(self.similarity_total / self.hits, 4) if self.hits else 0.0,
+            "term_mismatches": self.term_mismatches,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = AnswerCache()
+metrics.register("answer_cache", answer_cache.stats)
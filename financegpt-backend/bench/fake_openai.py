@@ -0,0 +1,162 @@
+import sys
+import json
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Stand-in for the OpenAI chat-completions and embeddings endpoints. Point the
+# backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1. Replies are
+# picked from the prompt so every agent gets a well-formed answer.
+
+config = {
+    "latency": 0.3,            # seconds before the first token / the response
+    "tokens_per_sec": 60.0,    # streaming rate once tokens flow
+    "answer_tokens": 250,      # words in a synthesized answer
+    "embedding_latency": 0.05,
+    "embedding_dim": 1536,
+}
+
+app = FastAPI(title="Fake OpenAI")
+
+_ANSWER_WORDS = (
+    "Based on your profile a low risk fixed deposit such as Secure FD Plus offers a stable 7.2% return "
+    "over 24 months while the Ultra Growth Fund suits long term goals with higher volatility. Consider "
+    "your emergency savings first then split monthly investments between debt and equity products."
+).split()
+
+
+def _reply(prompt: str) -> str:
+    if "classification agent" in prompt:
+        return "DB_QUERY,PDF_EXTRACTION,EXTERNAL_API"
+    if "expert SQL programmer" in prompt:
+        return "SELECT name, type, interest_rate, min_amount, risk_level FROM financial_products WHERE risk_level = 'Low'"
+    if "follow-up questions" in prompt:
+        return json.dumps([
+            "What is the penalty for breaking the FD early?",
+            "How is the mutual fund taxed?",
+            "Can I start a SIP with 1000 rupees?",
+        ])
+    words = [_ANSWER_WORDS[i % len(_ANSWER_WORDS)] for i in range(config["answer_tokens"])]
+    return " ".join(words)
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    # Rough token counts; good enough for tokens/sec accounting
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(completion) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    body = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        body["usage"] = usage
+    return f"data: {json.dumps(body)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o-mini")
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    content = _reply(prompt)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    if not body.get("stream"):
+        await asyncio.sleep(config["latency"] + len(content.split()) / config["tokens_per_sec"])
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(prompt, content),
+        })
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    async def events():
+        await asyncio.sleep(config["latency"])
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        interval = 1.0 / config["tokens_per_sec"]
+        for index, word in enumerate(content.split()):
+            yield _chunk(completion_id, model, {"content": word if index == 0 else " " + word})
+            await asyncio.sleep(interval)
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        if include_usage:
+            yield _chunk(completion_id, model, {}, usage=_usage(prompt, content))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _vector(text) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(str(text).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(config["embedding_dim"]).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input")
+    # A single string, a list of strings, or (pre-tokenized) lists of token ids
+    if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    await asyncio.sleep(config["embedding_latency"])
+    data = []
+    for index, text in enumerate(inputs):
+        vector = _vector(text)
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        data.append({"object": "embedding", "index": index, "embedding": embedding})
+    tokens = sum(max(1, len(str(text)) // 4) for text in inputs)
+    return JSONResponse({
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local fake OpenAI server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"])
+    parser.add_argument("--answer-tokens", type=int, default=config["answer_tokens"])
+    parser.add_argument("--embedding-latency", type=float, default=config["embedding_latency"])
+    parser.add_argument("--embedding-dim", type=int, default=config["embedding_dim"])
+    args = parser.parse_args(argv)
+    config.update(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+        embedding_latency=args.embedding_latency,
+        embedding_dim=args.embedding_dim,
+    )
+    import uvicorn
+    logger.info(f"Fake OpenAI on http://{args.host}:{args.port}/v1 with {config}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
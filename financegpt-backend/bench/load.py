@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import httpx
+import numpy as np
+import websockets
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# The user bench.seed creates
+BENCH_EMAIL = os.getenv("BENCH_EMAIL", "bench@example.com")
+BENCH_PASSWORD = os.getenv("BENCH_PASSWORD", "bench-password")
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+BENCH_QUERIES = [
+    "Which fixed deposits have the lowest risk?",
+    "Tell me about the Secure FD Plus premature withdrawal penalty",
+    "What credit cards can I get with a credit score above 700?",
+    "Suggest a mutual fund for long term growth",
+    "Are there any offers right now?",
+    "Compare the health insurance plans",
+    "What is the minimum amount for the Ultra Growth Fund?",
+    "I want a safe investment for my parents",
+]
+
+
+class Result:
+    __slots__ = ("ok", "busy", "error", "ttft", "latency", "tokens", "stream_seconds")
+
+    def __init__(self):
+        self.ok = False
+        self.busy = False
+        self.error = None
+        self.ttft = None
+        self.latency = None
+        self.tokens = 0
+        self.stream_seconds = None
+
+
+async def _answer(ws, started: float) -> Result:
+    """Read one answer: text frames, then the recommendations (or error) frame."""
+    result = Result()
+    first = None
+    async for frame in ws:
+        if frame.startswith("{"):
+            try:
+                message = json.loads(frame)
+            except ValueError:
+                message = None
+            if isinstance(message, dict) and "session" in message and len(message) == 1:
+                continue
+            if isinstance(message, dict) and "recommendations" in message:
+                result.ok = True
+                break
+            if isinstance(message, dict) and "error" in message:
+                result.busy = bool(message.get("busy"))
+                result.error = message["error"]
+                break
+        now = time.perf_counter()
+        if first is None:
+            first = now
+            result.ttft = now - started
+        result.tokens += count_tokens(frame)
+    else:
+        result.error = "connection closed"
+    result.latency = time.perf_counter() - started
+    if first is not None:
+        result.stream_seconds = time.perf_counter() - first
+    return result
+
+
+async def _one_shot(url: str, token: str, query: str) -> Result:
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.send(json.dumps({"query": query, "token": token}))
+            return await _answer(ws, started)
+    except Exception as e:
+        result = Result()
+        result.error = f"{type(e).__name__}: {e}"
+        result.latency = time.perf_counter() - started
+        return result
+
+
+async def _worker(url: str, token: str, queries: List[str], pending: List[int], results: List[Result], session: bool):
+    if not session:
+        while pending:
+            index = pending.pop()
+            results.append(await _one_shot(url, token, queries[index % len(queries)]))
+        return
+    # Session mode: one connection carries this worker's share of the queries
+    ws = None
+    try:
+        while pending:
+            index = pending.pop()
+            started = time.perf_counter()
+            try:
+                if ws is None:
+                    ws = await websockets.connect(url, max_size=None)
+                    await ws.send(json.dumps({"query": queries[index % len(queries)], "token": token, "session": True}))
+                else:
+                    await ws.send(json.dumps({"query": queries[index % len(queries)]}))
+                results.append(await _answer(ws, started))
+            except Exception as e:
+                result = Result()
+                result.error = f"{type(e).__name__}: {e}"
+                result.latency = time.perf_counter() - started
+                results.append(result)
+                if ws is not None:
+                    await ws.close()
+                ws = None
+    finally:
+        if ws is not None:
+            await ws.close()
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    ms = np.array(values) * 1000
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 1),
+        "p95": round(float(np.percentile(ms, 95)), 1),
+        "p99": round(float(np.percentile(ms, 99)), 1),
+        "mean": round(float(ms.mean()), 1),
+    }
+
+
+def summarize(results: List[Result], wall_seconds: float) -> Dict:
+    ok = [r for r in results if r.ok]
+    errors = {}
+    for r in results:
+        if not r.ok:
+            errors[r.error or "unknown"] = errors.get(r.error or "unknown", 0) + 1
+    rates = [r.tokens / r.stream_seconds for r in ok if r.stream_seconds]
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else None,
+        "busy": sum(1 for r in results if r.busy),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_rps": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "ttft_ms": _percentiles([r.ttft for r in ok if r.ttft is not None]),
+        "latency_ms": _percentiles([r.latency for r in ok]),
+        "tokens_per_sec": {
+            "per_stream_p50": round(float(np.percentile(rates, 50)), 1) if rates else None,
+            "aggregate": round(sum(r.tokens for r in ok) / wall_seconds, 1) if wall_seconds else None,
+        },
+    }
+
+
+def _git_revision() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def login(api_url: str, email: str, password: str) -> str:
+    response = httpx.post(f"{api_url}/auth/login", json={"email": email, "password": password}, timeout=30)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run(args) -> Dict:
+    token = args.token or login(args.api, args.email, args.password)
+    queries = BENCH_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    if args.warmup:
+        await asyncio.gather(*(_one_shot(args.url, token, q) for q in queries[:args.warmup]))
+    pending = list(range(args.requests))[::-1]
+    results = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(args.url, token, queries, pending, results, args.session) for _ in range(args.concurrency)
+    ))
+    wall = time.perf_counter() - started
+    return {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **_git_revision(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "session": args.session,
+            "queries": len(queries),
+        },
+        **summarize(results, wall),
+    }
+
+
+def report(path: str, last: int):
+    """One line per recorded run, oldest first, for comparing commits."""
+    with open(path, encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()][-last:]
+    header = f"{'commit':<10} {'label':<16} {'conc':>4} {'req':>5} {'err%':>6} {'ttft p50':>9} {'ttft p95':>9} {'ttft p99':>9} {'lat p50':>9} {'lat p95':>9} {'lat p99':>9} {'tok/s':>8} {'rps':>6}"
+    print(header)
+    for r in runs:
+        commit = (r.get("commit") or "-") + ("*" if r.get("dirty") else "")
+        print(
+            f"{commit:<10} {(r.get('label') or '')[:16]:<16} {r['config']['concurrency']:>4} {r['requests']:>5} "
+            f"{100 * (r['error_rate'] or 0):>6.2f} {r['ttft_ms']['p50'] or 0:>9.1f} {r['ttft_ms']['p95'] or 0:>9.1f} "
+            f"{r['ttft_ms']['p99'] or 0:>9.1f} {r['latency_ms']['p50'] or 0:>9.1f} {r['latency_ms']['p95'] or 0:>9.1f} "
+            f"{r['latency_ms']['p99'] or 0:>9.1f} {r['tokens_per_sec']['aggregate'] or 0:>8.1f} {r['throughput_rps'] or 0:>6.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WebSocket load generator for /ws/stream")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="run a load test and append the result")
+    run_parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/stream")
+    run_parser.add_argument("--api", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--email", default=BENCH_EMAIL)
+    run_parser.add_argument("--password", default=BENCH_PASSWORD)
+    run_parser.add_argument("--token", default=None, help="JWT to use instead of logging in")
+    run_parser.add_argument("-c", "--concurrency", type=int, default=10)
+    run_parser.add_argument("-n", "--requests", type=int, default=100)
+    run_parser.add_argument("--session", action="store_true", help="reuse one session connection per worker")
+    run_parser.add_argument("--queries", default=None, help="file with one query per line")
+    run_parser.add_argument("--warmup", type=int, default=2, help="queries sent once before measuring")
+    run_parser.add_argument("--label", default="")
+    run_parser.add_argument("--out", default=RESULTS_PATH)
+    report_parser = sub.add_parser("report", help="compare recorded runs")
+    report_parser.add_argument("--out", default=RESULTS_PATH)
+    report_parser.add_argument("--last", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        report(args.out, args.last)
+        return
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+import os
+import sys
+import logging
+import argparse
+from passlib.context import CryptContext
+from sqlalchemy import inspect, text
+from database import engine, SessionLocal
+from models.models import User, UserProfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BENCH_EMAIL = os.getenv("BENCH_EMAIL", "bench@example.com")
+BENCH_PASSWORD = os.getenv("BENCH_PASSWORD", "bench-password")
+# Same hashing as routes.auth, without importing the app (and its OpenAI client)
+_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "db_setup.sql")
+
+
+def apply_schema(path: str = SCHEMA_PATH) -> bool:
+    """Create the tables and sample data from db_setup.sql on an empty database."""
+    if inspect(engine).has_table("financial_products"):
+        logger.info("Schema already present, leaving sample data as is")
+        return False
+    with open(path, encoding="utf-8") as f:
+        script = f.read()
+    # db_setup.sql uses $$-quoted function bodies, so run it as one script on the raw driver
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(script)
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Applied {path}")
+    return True
+
+
+def seed_user(email: str = BENCH_EMAIL, password: str = BENCH_PASSWORD) -> int:
+    """Create (once) the user the load generator signs in as."""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        if user is None:
+            user = User(email=email, password_hash=_pwd_context.hash(password))
+            db.add(user)
+            db.flush()
+            db.add(UserProfile(
+                user_id=user.id,
+                name="Bench User",
+                age=34,
+                income=1200000,
+                employment_type="Salaried",
+                risk_appetite="Medium",
+                financial_goals="Retirement, child education",
+                credit_score=760,
+                kyc_verified="Yes",
+            ))
+            db.commit()
+            logger.info(f"Created bench user {email}")
+        return user.id
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a local database for load tests")
+    parser.add_argument("--schema", default=SCHEMA_PATH)
+    parser.add_argument("--email", default=BENCH_EMAIL)
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--reset-logs", action="store_true", help="delete earlier query_logs rows")
+    args = parser.parse_args(argv)
+    apply_schema(args.schema)
+    seed_user(args.email, args.password)
+    if args.reset_logs:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM query_logs"))
+    print(f"Seeded {engine.url.render_as_string(hide_password=True)}; bench user {args.email}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(sys.argv[1:])
@@ -42,9 +42,13 @@ CREATE TABLE IF NOT EXISTS query_logs (
     answer TEXT NOT NULL,
     confidence_score NUMERIC(3,2) NOT NULL,
     processing_time NUMERIC(8,3) NOT NULL,
+    stage_timings JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Per-stage timings and token counts (databases created before the column existed)
+ALTER TABLE query_logs ADD COLUMN IF NOT EXISTS stage_timings JSONB;
+
 -- Offers table
 CREATE TABLE IF NOT EXISTS offers (
     id SERIAL PRIMARY KEY,
@@ -54,6 +58,19 @@ CREATE TABLE IF NOT EXISTS offers (
     valid_till DATE NOT NULL
 );
 
+-- Notify listeners (the backend's offers cache) when offers change
+CREATE OR REPLACE FUNCTION notify_offers_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('offers_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS offers_changed ON offers;
+CREATE TRIGGER offers_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON offers
+FOR EACH STATEMENT EXECUTE FUNCTION notify_offers_changed();
+
 -- Sample data
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
@@ -99,6 +116,7 @@ CREATE TABLE IF NOT EXISTS query_logs (
     answer TEXT NOT NULL,
     confidence_score NUMERIC(3,2) NOT NULL,
     processing_time NUMERIC(8,3) NOT NULL,
+    stage_timings JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -111,6 +129,19 @@ CREATE TABLE IF NOT EXISTS offers (
     valid_till DATE NOT NULL
 );
 
+-- Notify listeners (the backend's in-memory product snapshot) when the catalog changes
+CREATE OR REPLACE FUNCTION notify_financial_products_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('financial_products_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS financial_products_changed ON financial_products;
+CREATE TRIGGER financial_products_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON financial_products
+FOR EACH STATEMENT EXECUTE FUNCTION notify_financial_products_changed();
+
 -- Sample data
 INSERT INTO public.financial_products 
 (id, name, type, interest_rate, min_amount, risk_level, tenure_months, eligibility)
@@ -149,5 +180,4 @@ VALUES
 (7, 'Cashback Credit', NULL, '2X cashback for first 3 months', '2025-09-30'),
 (8, 'LifeCare Policy', NULL, '₹1000 bonus on annual premium > ₹50,000', '2026-01-15'),
 (9, 'HealthShield', NULL, 'Flat 15% discount on premiums', '2025-12-15'),
-(10, 'Smart EMI Loan', '9.5%', 'No processing fee + free credit report', '2025-11-30'),
-
+(10, 'Smart EMI Loan', '9.5%', 'No processing fee + free credit report', '2025-11-30');
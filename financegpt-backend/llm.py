@@ -0,0 +1,91 @@
+import os
+import asyncio
+import logging
+import httpx
+from openai import AsyncOpenAI
+import tracing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_MAX_CONCURRENT_STREAMS = int(os.getenv("LLM_MAX_CONCURRENT_STREAMS", "64"))
+LLM_STREAM_ACQUIRE_TIMEOUT = float(os.getenv("LLM_STREAM_ACQUIRE_TIMEOUT", "10"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# One pooled HTTP connection pool and one async client shared by every LLM call
+# in the process (classification, SQL generation, synthesis, recommendations).
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=10.0),
+)
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=http_client,
+    max_retries=LLM_MAX_RETRIES,
+)
+
+_stream_slots = asyncio.Semaphore(LLM_MAX_CONCURRENT_STREAMS)
+
+
+class LLMBusyError(Exception):
+    pass
+
+
+async def complete(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0, max_tokens: int = None) -> str:
+    kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        **kwargs
+    )
+    if response.usage is not None:
+        tracing.record_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+async def stream_chat(prompt: str, model: str = DEFAULT_MODEL, temperature: float = 0.1, max_tokens: int = 2000):
+    """
+    Async generator yielding content deltas of a streamed chat completion.
+    At most LLM_MAX_CONCURRENT_STREAMS streams are in flight; the next delta is
+    only read from the connection once the consumer asks for it, so a slow
+    WebSocket consumer slows the upstream read instead of buffering tokens.
+    """
+    try:
+        await asyncio.wait_for(_stream_slots.acquire(), timeout=LLM_STREAM_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise LLMBusyError("Too many concurrent answers in progress, please retry shortly")
+    try:
+        # Token usage arrives in one extra final chunk; only ask for it when tracing
+        traced = tracing.active()
+        response_stream = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **({"stream_options": {"include_usage": True}} if traced else {})
+        )
+        try:
+            async for chunk in response_stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                elif traced and chunk.usage is not None:
+                    tracing.record_tokens(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        finally:
+            await response_stream.close()
+    finally:
+        _stream_slots.release()
+
+
+async def aclose():
+    await client.close()
@@ -3,28 +3,36 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 from dotenv import load_dotenv
 import asyncio
+import functools
 from typing import List, Optional
+from contextlib import aclosing
 import json
-import threading
 import os
 from jose import JWTError, jwt
 import uuid
 import re
+import time
 
 from prompts.report_prompt import FINAL_RESPONSE_PROMPT
 from routes.query import (
     router as query_router,
-    openai_client,
-    run_sql_agent_sync,
-    run_pdf_agent_sync,
+    sql_agent,
+    pdf_agent,
     get_user_info_from_token,
     run_all_agents,
-    stream_openai_response,
     generate_recommendations,
-    log_query,
-    get_offers_from_db
+    offers_cache
 )
 from routes.auth import router as auth_router, SECRET_KEY, ALGORITHM
+from routes.stats import router as stats_router
+from prompt_context import build_prompt_context, shared_profile, profile_bucket
+from cache import normalize_query, content_hash
+from singleflight import flights, synthesis_flight, COALESCE_SYNTHESIS
+from answer_cache import answer_cache, chunk_answer, ANSWER_CACHE_ENABLED
+from query_log import query_log_writer
+from tokens import count_tokens
+import tracing
+from sessions import sessions, WS_SESSION_IDLE_TIMEOUT
 
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
@@ -33,6 +41,8 @@ from database import SessionLocal
 from models.models import Offer, QueryLog, User, UserProfile
 from prompts.recommendations_prompt import RECOMMENDATIONS_PROMPT
 from agents.classification_agent import ClassificationAgent
+import llm
+from stages import stages, StageBusyError, BUSY_MESSAGE, shutdown as shutdown_stages
 
 # Load environment variables
 load_dotenv()
@@ -56,6 +66,23 @@ app.add_middleware(
 # Include routers
 app.include_router(query_router)
 app.include_router(auth_router)
+app.include_router(stats_router)
+
+# Seconds a single chunk may wait on a slow WebSocket consumer before the stream is abandoned
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "30"))
+# Recommendations start from the partial answer once this many tokens have
+# streamed, and may delay the final frame by at most the deadline in seconds
+RECOMMENDATIONS_START_TOKENS = int(os.getenv("RECOMMENDATIONS_START_TOKENS", "150"))
+RECOMMENDATIONS_DEADLINE = float(os.getenv("RECOMMENDATIONS_DEADLINE", "1.5"))
+
+@app.on_event("shutdown")
+async def shutdown():
+    classification_agent.save_cache()
+    sql_agent.close()
+    offers_cache.stop()
+    await query_log_writer.close()
+    await llm.aclose()
+    shutdown_stages()
 
 # Dependency to get DB session
 def get_db():
@@ -67,10 +94,168 @@ def get_db():
 
 classification_agent = ClassificationAgent()
 
+
+async def recommend(trace_id: str, query: str, answer: str) -> List[str]:
+    try:
+        with tracing.span("recommendations"):
+            # Clients sharing a synthesis stream reach the threshold with the same partial answer
+            key = content_hash(normalize_query(query), answer)
+            return await flights["recommendations"].do(key, stages["recommendations"].run_async, generate_recommendations, query, answer)
+    except StageBusyError:
+        logger.warning(f"Skipping recommendations for trace_id={trace_id}: stage busy")
+        return []
+
+
+async def await_recommendations(trace_id: str, task: asyncio.Task) -> List[str]:
+    try:
+        return await asyncio.wait_for(task, timeout=RECOMMENDATIONS_DEADLINE)
+    except asyncio.TimeoutError:
+        logger.warning(f"Recommendations for trace_id={trace_id} missed the {RECOMMENDATIONS_DEADLINE}s deadline")
+        return []
+
+
+async def synthesize(prompt: str):
+    async with stages["synthesis"].slot(), aclosing(llm.stream_chat(prompt, temperature=0.1, max_tokens=2000)) as stream:
+        async for chunk in stream:
+            yield chunk
+
+
+def data_version():
+    # Cached answers are dropped when the products or the live offers change
+    snapshot = sql_agent.snapshot
+    return (snapshot.version if snapshot else None, offers_cache.version)
+
+
+async def lookup_answer(trace_id: str, query: str, user_profile_dict: dict):
+    """Embed the query and look it up in the answer cache; returns (entry or None, probe to store with)."""
+    with tracing.span("answer_cache"):
+        try:
+            embedding = await stages["retrieval"].run(pdf_agent.embed_query, query)
+        except StageBusyError:
+            raise
+        except Exception as e:
+            logger.warning(f"Answer cache lookup skipped for trace_id={trace_id}: {str(e)}")
+            return None, None
+        probe = (embedding, profile_bucket(user_profile_dict), data_version())
+        return answer_cache.lookup(*probe, query), probe
+
+
+async def replay_answer(websocket: WebSocket, trace_id: str, entry: dict):
+    logger.info(f"Answering trace_id={trace_id} from the answer cache (similarity {entry['similarity']:.3f} to '{entry['query']}')")
+    stream_started = time.perf_counter()
+    for index, chunk in enumerate(chunk_answer(entry["answer"])):
+        if index == 0:
+            tracing.record("ttft", time.perf_counter() - stream_started)
+        await asyncio.wait_for(websocket.send_text(chunk), timeout=WS_SEND_TIMEOUT)
+    return entry["answer"], entry["recommendations"]
+
+
+async def stream_answer(websocket: WebSocket, trace_id: str, query: str, user_profile_dict: dict, chat_history: str = ""):
+    """Run the agents and synthesis, streaming the answer; returns (answer, recommendations)."""
+    recommendations_task = None
+    try:
+        # --- Classification and agent fan-out ---
+        categories, context = await run_all_agents(query, classify=classification_agent.process_query)
+        logger.info(f"Classification categories for query '{query}': {categories}")
+        logger.info(f"Agent context for trace_id={trace_id}: {context}")
+        # --- End classification and agent fan-out ---
+        # A first question's answer may be shared with identical ones in flight or cached for
+        # similar ones; the prompt then holds only the profile bucket, so the answer is not personal
+        shared = (COALESCE_SYNTHESIS or ANSWER_CACHE_ENABLED) and not chat_history
+        with tracing.span("prompt_build"):
+            profile = shared_profile(user_profile_dict) if shared else user_profile_dict
+            prompt_fields, context_tokens = build_prompt_context(profile, context, chat_history=chat_history)
+        logger.info(f"Prompt context tokens for trace_id={trace_id}: {context_tokens}")
+        analysis_prompt = FINAL_RESPONSE_PROMPT.format(query=query, **prompt_fields)
+        logger.info(f"Analysis prompt prepared for OpenAI streaming. Trace ID: {trace_id}")
+        answer_chunks = []
+        streamed_tokens = 0
+        if shared and COALESCE_SYNTHESIS:
+            source = synthesis_flight.stream(content_hash(analysis_prompt), functools.partial(synthesize, analysis_prompt))
+        else:
+            source = synthesize(analysis_prompt)
+        stream_started = time.perf_counter()
+        with tracing.span("synthesis"):
+            async with aclosing(source) as stream:
+                async for chunk in stream:
+                    if not answer_chunks:
+                        tracing.record("ttft", time.perf_counter() - stream_started)
+                    answer_chunks.append(chunk)
+                    if recommendations_task is None:
+                        streamed_tokens += count_tokens(chunk)
+                        if streamed_tokens >= RECOMMENDATIONS_START_TOKENS:
+                            # Enough of the answer to suggest follow-ups from; generate them while the rest streams
+                            recommendations_task = asyncio.create_task(recommend(trace_id, query, ''.join(answer_chunks)))
+                    # Awaiting each send paces the upstream read to the consumer (or, for a
+                    # shared stream, this client's reads from the buffer)
+                    await asyncio.wait_for(websocket.send_text(chunk), timeout=WS_SEND_TIMEOUT)
+        answer_full = ''.join(answer_chunks)
+        logger.info(f"Streaming complete for trace_id={trace_id}. Answer length: {len(answer_full)}")
+        if recommendations_task is None:
+            recommendations_task = asyncio.create_task(recommend(trace_id, query, answer_full))
+        recommendations = await await_recommendations(trace_id, recommendations_task)
+    finally:
+        if recommendations_task is not None and not recommendations_task.done():
+            recommendations_task.cancel()
+    return answer_full, recommendations
+
+
+async def answer_query(websocket: WebSocket, user, user_profile_dict: dict, query: str, chat_history: str = "") -> str:
+    """Run one query through the pipeline, streaming the answer and then the recommendations frame."""
+    # Generate a trace_id
+    trace_id = str(uuid.uuid4())
+    start_time = time.time()
+    logger.info(f"Processing query with trace_id={trace_id}: {query}")
+    trace = tracing.start(trace_id)
+    try:
+        cached, probe = None, None
+        if ANSWER_CACHE_ENABLED and not chat_history:
+            cached, probe = await lookup_answer(trace_id, query, user_profile_dict)
+        if cached is not None:
+            answer_full, recommendations = await replay_answer(websocket, trace_id, cached)
+        else:
+            answer_full, recommendations = await stream_answer(websocket, trace_id, query, user_profile_dict, chat_history)
+            if probe is not None:
+                answer_cache.store(*probe, query, answer_full, recommendations)
+    finally:
+        stage_timings = tracing.finish(trace)
+    logger.info(f"Recommendations generated for trace_id={trace_id}: {recommendations}")
+    await websocket.send_text(json.dumps({"recommendations": recommendations}))
+    # Queue the query log; it is written in the next batch
+    processing_time = round(time.time() - start_time, 3)
+    await query_log_writer.submit(trace_id, user, query, answer_full, processing_time, stage_timings)
+    logger.info(f"Query log queued for trace_id={trace_id}. Processing time: {processing_time}s")
+    return answer_full
+
+
+async def next_session_query(websocket: WebSocket, session) -> Optional[str]:
+    """Wait for the next query on a session; None once the session should end."""
+    while True:
+        try:
+            data = await asyncio.wait_for(websocket.receive_text(), timeout=WS_SESSION_IDLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.info(f"Closing chat session {session.id}: idle for {WS_SESSION_IDLE_TIMEOUT}s")
+            sessions.close(session, idle=True)
+            await websocket.close(code=1000, reason="Session idle")
+            return None
+        if session.expired:
+            await websocket.send_text(json.dumps({"error": "Session expired, please sign in again"}))
+            await websocket.close()
+            return None
+        try:
+            query = json.loads(data).get("query")
+        except (ValueError, AttributeError):
+            query = None
+        if query:
+            return query
+        await websocket.send_text(json.dumps({"error": "No query provided"}))
+
+
 @app.websocket("/ws/stream")
 async def websocket_stream(websocket: WebSocket):
     logger.info("WebSocket connection initiated at /ws/stream")
     await websocket.accept()
+    session = None
     try:
         data = await websocket.receive_text()
         logger.info(f"Received data from client: {data}")
@@ -89,76 +274,48 @@ async def websocket_stream(websocket: WebSocket):
             return
         # Validate JWT and get user/profile
         try:
-            user, user_profile_dict, db = get_user_info_from_token(token)
-            logger.info(f"User authenticated: {user.email if hasattr(user, 'email') else str(user)}")
+            user, user_profile_dict = await stages["db"].run(get_user_info_from_token, token)
+            logger.info(f"User authenticated: {user.email}")
         except Exception as e:
             logger.error(f"JWT validation or user fetch failed: {str(e)}")
             await websocket.send_text(json.dumps({"error": str(e)}))
             await websocket.close()
             return
-        # Generate a trace_id
-        trace_id = str(uuid.uuid4())
-        import time
-        start_time = time.time()
-        logger.info(f"Processing query with trace_id={trace_id}: {query}")
-        # --- Classification step ---
-        categories = classification_agent.process_query(query)
-        logger.info(f"Classification categories for query '{query}': {categories}")
-        sql_data = sql_explanation = pdf_response = api_response = None
-        if "DB_QUERY" in categories or "BOTH" in categories:
-            sql_result = run_sql_agent_sync(query)
-            sql_data = sql_result.get("result", "No SQL data available")
-            sql_explanation = sql_result.get("explanation", "")
-            logger.info(f"SQL Agent result: {sql_data}, explanation: {sql_explanation}")
-        if "PDF_EXTRACTION" in categories or "BOTH" in categories:
-            pdf_result = run_pdf_agent_sync(query)
-            pdf_response = pdf_result.get("response", "No PDF data available")
-            logger.info(f"PDF Agent result: {pdf_response}")
-        if "EXTERNAL_API" in categories:
-            api_response = get_offers_from_db(db)
-            logger.info(f"Offers DB result: {api_response}")
-        # --- End classification step ---
-        analysis_prompt = FINAL_RESPONSE_PROMPT.format(
-            user_profile=json.dumps(user_profile_dict, indent=2),
-            chat_history="",  # No chat history
-            query=query,
-            sql_data=sql_data,
-            sql_explanation=sql_explanation,
-            pdf_response=pdf_response,
-            api_response=api_response
-        )
-        logger.info(f"Analysis prompt prepared for OpenAI streaming. Trace ID: {trace_id}")
-        queue = asyncio.Queue()
-        stop_token = object()
-        answer_chunks = []
-        loop = asyncio.get_running_loop()
-        thread = threading.Thread(target=stream_openai_response, args=(analysis_prompt, queue, stop_token, answer_chunks, loop))
-        thread.start()
-        while True:
-            chunk = await queue.get()
-            if chunk is stop_token:
-                break
-            await websocket.send_text(chunk)
-        answer_full = ''.join(answer_chunks)
-        logger.info(f"Streaming complete for trace_id={trace_id}. Answer length: {len(answer_full)}")
-        # Generate recommendations using LLM
-        recommendations = generate_recommendations(query, answer_full)
-        logger.info(f"Recommendations generated for trace_id={trace_id}: {recommendations}")
-        await websocket.send_text(json.dumps({"recommendations": recommendations}))
-        await websocket.close()
-        # After streaming, log the query
-        end_time = time.time()
-        processing_time = round(end_time - start_time, 3)
-        log_query(trace_id, user, query, answer_full, processing_time, db)
-        logger.info(f"Query logged for trace_id={trace_id}. Processing time: {processing_time}s")
-        db.close()
+        if not data_json.get("session"):
+            await answer_query(websocket, user, user_profile_dict, query)
+            await websocket.close()
+            return
+        # Session mode: the connection stays open for follow-up queries, which
+        # reuse this authentication and see the conversation so far
+        session = sessions.open(user, user_profile_dict, jwt.get_unverified_claims(token).get("exp"))
+        await websocket.send_text(json.dumps({"session": session.id}))
+        while query is not None:
+            try:
+                answer = await answer_query(websocket, user, user_profile_dict, query, session.chat_history())
+                sessions.record(session, query, answer)
+            except (StageBusyError, llm.LLMBusyError) as e:
+                logger.warning(f"Rejecting query on chat session {session.id}: {str(e)}")
+                await websocket.send_text(json.dumps({"error": BUSY_MESSAGE, "busy": True}))
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logger.error(f"Exception in chat session {session.id}: {str(e)}")
+                await websocket.send_text(json.dumps({"error": str(e)}))
+            query = await next_session_query(websocket, session)
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected by client.")
         pass
+    except (StageBusyError, llm.LLMBusyError) as e:
+        logger.warning(f"Rejecting websocket request: {str(e)}")
+        await websocket.send_text(json.dumps({"error": BUSY_MESSAGE, "busy": True}))
+        await websocket.close()
     except Exception as e:
         logger.error(f"Exception in websocket_stream: {str(e)}")
         await websocket.send_text(json.dumps({"error": str(e)}))
         await websocket.close()
+    finally:
+        if session is not None:
+            sessions.close(session)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, DECIMAL, ForeignKey, Date, func
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import JSONB
 from database import Base
 
 class User(Base):
@@ -46,6 +47,7 @@ class QueryLog(Base):
     answer = Column(Text, nullable=False)
     confidence_score = Column(DECIMAL(3,2), nullable=False)
     processing_time = Column(DECIMAL(8,3), nullable=False)
+    stage_timings = Column(JSONB)
     created_at = Column(DateTime, server_default=func.now())
     user = relationship('User', back_populates='query_logs')
 
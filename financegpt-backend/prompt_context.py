@@ -0,0 +1,179 @@
+import os
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
+from tokens import count_tokens, truncate_tokens
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Total tokens the variable parts of FINAL_RESPONSE_PROMPT may use, and each
+# source's share of it. A source that needs less than its share hands the
+# rest to the sources that need more.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_SHARES = {
+    name: float(share)
+    for name, share in (
+        item.split(":") for item in os.getenv(
+            "CONTEXT_SHARES", "user_profile:0.05,chat_history:0.2,sql_data:0.35,pdf_response:0.25,api_response:0.15"
+        ).split(",") if item.strip()
+    )
+}
+CONTEXT_SQL_EXPLANATION_TOKENS = int(os.getenv("CONTEXT_SQL_EXPLANATION_TOKENS", "100"))
+# Lower bounds of the age bands in a profile bucket: "<25", "25-34", ..., "60+"
+PROFILE_AGE_BANDS = [int(age) for age in os.getenv("PROFILE_AGE_BANDS", "25,35,45,60").split(",") if age.strip()]
+
+_OFFER_COLUMNS = ["product_name", "promo_interest_rate", "signup_bonus", "valid_till"]
+
+
+def age_band(age) -> str:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    if not PROFILE_AGE_BANDS or age < PROFILE_AGE_BANDS[0]:
+        return f"<{PROFILE_AGE_BANDS[0]}" if PROFILE_AGE_BANDS else "any"
+    for low, high in zip(PROFILE_AGE_BANDS, PROFILE_AGE_BANDS[1:]):
+        if low <= age < high:
+            return f"{low}-{high - 1}"
+    return f"{PROFILE_AGE_BANDS[-1]}+"
+
+
+def shared_profile(user_profile: Dict) -> Dict[str, str]:
+    """
+    The coarse part of a profile that many users have in common: risk appetite,
+    employment type and age band. An answer written from it alone carries no
+    personal details, so it can be shared between users in the same bucket.
+    """
+    return {
+        "risk_appetite": str(user_profile.get("risk_appetite") or "unknown").strip().lower(),
+        "employment_type": str(user_profile.get("employment_type") or "unknown").strip().lower(),
+        "age_band": age_band(user_profile.get("age")),
+    }
+
+
+def profile_bucket(user_profile: Dict) -> str:
+    return "|".join(shared_profile(user_profile).values())
+
+
+def _cell(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, Decimal):
+        return format(value.normalize(), "f") if value == value.to_integral() else str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _table(columns: List[str], rows: List) -> List[str]:
+    """Compact pipe table: a header line, then one line per row."""
+    lines = [" | ".join(columns)] if columns else []
+    for row in rows:
+        values = [row.get(c) for c in columns] if isinstance(row, dict) else row
+        lines.append(" | ".join(_cell(v) for v in values))
+    return lines
+
+
+def _fit_lines(lines: List[str], budget: int, keep_header: bool, noun: str, from_end: bool = False) -> str:
+    """Keep whole lines in order (or the latest ones) while they fit, then say how many were dropped."""
+    text = "\n".join(lines)
+    if count_tokens(text) <= budget:
+        return text
+    header = lines[:1] if keep_header else []
+    body = lines[len(header):]
+    kept = []
+    used = count_tokens("\n".join(header)) + 12  # room for the "more" note
+    for line in (reversed(body) if from_end else body):
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    if from_end:
+        kept.reverse()
+    dropped = len(body) - len(kept)
+    note = f"({dropped} earlier {noun} omitted)" if from_end else f"(... {dropped} more {noun} not shown)"
+    return "\n".join(header + ([note] if from_end else []) + kept + ([] if from_end else [note]))
+
+
+def _render(name: str, value) -> List[str]:
+    if value is None or value == "":
+        return []
+    if name == "sql_data" and isinstance(value, list):
+        if not value:
+            return ["(no matching rows)"]
+        columns = getattr(value, "columns", None) or [f"col{i + 1}" for i in range(len(value[0]))]
+        return _table(columns, value)
+    if name == "api_response" and isinstance(value, list):
+        return _table(_OFFER_COLUMNS, value) if value else ["(no current offers)"]
+    if name == "user_profile" and isinstance(value, dict):
+        return [f"{key}: {_cell(v)}" for key, v in value.items()]
+    if isinstance(value, (dict, list)):
+        return [json.dumps(value, default=str)]
+    return str(value).splitlines()
+
+
+def _allocate(needs: Dict[str, int], budget: int) -> Dict[str, int]:
+    """Water-filling: satisfy small sources in full, split what is left by share."""
+    allocation = {}
+    remaining = dict(needs)
+    left = budget
+    while remaining:
+        total_share = sum(CONTEXT_SHARES.get(name, 0.1) for name in remaining)
+        fair = {name: left * CONTEXT_SHARES.get(name, 0.1) / total_share for name in remaining}
+        satisfied = [name for name in remaining if remaining[name] <= fair[name]]
+        if not satisfied:
+            for name in sorted(remaining):
+                allocation[name] = int(fair[name])
+            break
+        for name in satisfied:
+            allocation[name] = remaining.pop(name)
+            left -= allocation[name]
+    return allocation
+
+
+def build_prompt_context(user_profile: Dict, context: Dict, chat_history: str = "",
+                         budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Render every FINAL_RESPONSE_PROMPT source compactly (SQL rows and offers as
+    column-labelled tables, the profile as key: value lines) and fit them into
+    the token budget. Overflow is cut deterministically: tables keep the header
+    and the first rows, chat history keeps the latest lines, free text keeps
+    its head. Returns the prompt fields and the tokens used per source.
+    """
+    sources = {
+        "user_profile": user_profile,
+        "chat_history": chat_history,
+        "sql_data": context.get("sql_data"),
+        "pdf_response": context.get("pdf_response"),
+        "api_response": context.get("api_response"),
+    }
+    rendered = {name: _render(name, value) for name, value in sources.items()}
+    needs = {name: count_tokens("\n".join(lines)) for name, lines in rendered.items()}
+    allocation = _allocate(needs, budget)
+
+    fields, usage = {}, {}
+    for name, lines in rendered.items():
+        if needs[name] <= allocation[name]:
+            text = "\n".join(lines)
+        elif name in ("sql_data", "api_response") and isinstance(sources[name], list):
+            text = _fit_lines(lines, allocation[name], keep_header=True, noun="rows")
+        elif name == "chat_history":
+            text = _fit_lines(lines, allocation[name], keep_header=False, noun="lines", from_end=True)
+        elif name == "user_profile":
+            text = _fit_lines(lines, allocation[name], keep_header=False, noun="fields")
+        else:
+            text = truncate_tokens("\n".join(lines), max(allocation[name] - 4, 0)) + " [...]"
+        fields[name] = text
+        usage[name] = count_tokens(text)
+    explanation = context.get("sql_explanation") or ""
+    fields["sql_explanation"] = truncate_tokens(str(explanation), CONTEXT_SQL_EXPLANATION_TOKENS)
+    usage["sql_explanation"] = count_tokens(fields["sql_explanation"])
+    usage["total"] = sum(usage.values())
+    usage["dropped"] = max(sum(needs.values()) - sum(usage[name] for name in needs), 0)
+    return fields, usage
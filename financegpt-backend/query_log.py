@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List
+from sqlalchemy.dialects.postgresql import insert
+from database import SessionLocal
+from models.models import QueryLog
+from stages import stages
+import metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "100"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "2"))
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+QUERY_LOG_PUT_TIMEOUT = float(os.getenv("QUERY_LOG_PUT_TIMEOUT", "5"))
+QUERY_LOG_RETRIES = int(os.getenv("QUERY_LOG_RETRIES", "3"))
+QUERY_LOG_DRAIN_TIMEOUT = float(os.getenv("QUERY_LOG_DRAIN_TIMEOUT", "10"))
+
+
+def _insert(rows: List[Dict]):
+    # One multi-row INSERT per batch; trace_id is unique, so a retried batch is a no-op
+    db = SessionLocal()
+    try:
+        db.execute(insert(QueryLog).on_conflict_do_nothing(index_elements=["trace_id"]), rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+class QueryLogWriter:
+    """
+    Write-behind buffer for query_logs. Requests enqueue a row and move on;
+    a background task writes rows in bulk once QUERY_LOG_BATCH_SIZE have
+    queued or QUERY_LOG_FLUSH_INTERVAL seconds have passed. The queue is
+    bounded: when the database falls behind, submit() waits (up to
+    QUERY_LOG_PUT_TIMEOUT) and then drops the row rather than grow memory.
+    close() drains whatever is still queued.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._task = None
+        self._closing = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed_batches = 0
+        self.flush_time_total = 0.0
+
+    def _start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=QUERY_LOG_QUEUE_SIZE)
+            self._task = asyncio.create_task(self._run(), name="query-log-writer")
+
+    async def submit(self, trace_id: str, user, query: str, answer: str, processing_time: float, stage_timings: Dict = None):
+        if self._closing:
+            logger.warning(f"Query log writer closed, dropping log for trace_id={trace_id}")
+            self.dropped += 1
+            return
+        self._start()
+        row = {
+            "trace_id": trace_id,
+            "user_id": user.id,
+            "user_name": user.name,
+            "query": query,
+            "answer": answer,
+            "confidence_score": 1.0,
+            "processing_time": processing_time,
+            "stage_timings": stage_timings,
+        }
+        try:
+            await asyncio.wait_for(self._queue.put(row), timeout=QUERY_LOG_PUT_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.error(f"Query log queue full, dropping log for trace_id={trace_id}")
+
+    async def _next_batch(self) -> List[Dict]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + QUERY_LOG_FLUSH_INTERVAL
+        while len(batch) < QUERY_LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if self._closing or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        while len(batch) < QUERY_LOG_BATCH_SIZE and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: List[Dict]):
+        for attempt in range(QUERY_LOG_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                await stages["db"].run(_insert, batch)
+                self.flush_time_total += time.perf_counter() - started
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                logger.warning(f"Writing {len(batch)} query logs failed (attempt {attempt + 1}): {str(e)}")
+                if attempt < QUERY_LOG_RETRIES and not self._closing:
+                    await asyncio.sleep(min(2 ** attempt, 30))
+        self.failed_batches += 1
+        self.dropped += len(batch)
+        logger.error(f"Dropped {len(batch)} query logs after {QUERY_LOG_RETRIES + 1} attempts")
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def close(self):
+        """Flush everything queued, then stop the writer."""
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=QUERY_LOG_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Query log drain timed out with {self._queue.qsize()} rows unwritten")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        logger.info(f"Query log writer stopped: {self.written} rows written in {self.batches} batches")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "flush_time_avg": round(self.flush_time_total / self.batches, 6) if self.batches else 0.0,
+            "failed_batches": self.failed_batches,
+            "dropped": self.dropped,
+        }
+
+
+query_log_writer = QueryLogWriter()
+metrics.register("query_log", query_log_writer.stats)
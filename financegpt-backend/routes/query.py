@@ -6,32 +6,36 @@ import logging
 import os
 from agents.sql_agent import SQLAgent
 from agents.pdf_agent import PDFAgent
+from agents.offers_cache import OfferSchema, offers_cache, select_offers
 from prompts.report_prompt import FINAL_RESPONSE_PROMPT
-from openai import OpenAI
 from concurrent.futures import ProcessPoolExecutor
 import json
 import httpx
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models.models import User, QueryLog, Offer
+from models.models import User, QueryLog
 from prompts.recommendations_prompt import RECOMMENDATIONS_PROMPT
 import threading
 import re
 import time
-from utils import get_user_info_from_token, generate_recommendations, log_query, QueryRequest
-from agents.classification_agent import ClassificationAgent
+from utils import get_user_info_from_token, generate_recommendations, QueryRequest
 from datetime import date
+from stages import stages, StageBusyError
+import metrics
+import tracing
+from cache import normalize_query
+from singleflight import flights
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize OpenAI client and agents
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize agents
 sql_agent = SQLAgent(table_name="financial_products")
 pdf_agent = PDFAgent()
-classification_agent = ClassificationAgent()
+offers_cache.start()
+metrics.register("offers_cache", offers_cache.stats)
 
 # Create a global process pool executor
 process_pool = ProcessPoolExecutor(max_workers=3)
@@ -41,36 +45,104 @@ process_pool = ProcessPoolExecutor(max_workers=3)
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
-async def run_all_agents(query: str, db: Session):
-    loop = asyncio.get_running_loop()
-    sql_future = loop.run_in_executor(None, run_sql_agent_sync, query)
-    pdf_future = loop.run_in_executor(None, run_pdf_agent_sync, query)
-    offers_future = loop.run_in_executor(None, get_offers_from_db, db)
-    sql_result, pdf_result, offers_result = await asyncio.gather(sql_future, pdf_future, offers_future)
-    sql_data = sql_result.get("result", "No SQL data available")
-    sql_explanation = sql_result.get("explanation", "")
-    pdf_response = pdf_result.get("response", "No PDF data available")
-    api_response = offers_result  # This is now a list of offers
-    return sql_data, sql_explanation, pdf_response, api_response
-
-def stream_openai_response(analysis_prompt, queue, stop_token, answer_chunks, loop):
-    response_stream = openai_client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": analysis_prompt}],
-        temperature=0.1,
-        max_tokens=2000,
-        stream=True
-    )
-    for chunk in response_stream:
-        if hasattr(chunk.choices[0].delta, "content") and chunk.choices[0].delta.content:
-            content = chunk.choices[0].delta.content
-            answer_chunks.append(content)
-            asyncio.run_coroutine_threadsafe(queue.put(content), loop)
-    asyncio.run_coroutine_threadsafe(queue.put(stop_token), loop)
-
-def run_sql_agent_sync(query: str) -> Dict:
+# Per-branch settings for the agent fan-out. A branch runs when the classifier
+# returns any of its categories; speculative branches start before the
+# classifier answers and are cancelled or discarded if it rules them out.
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+SPECULATIVE_BRANCHES = [b.strip() for b in os.getenv("SPECULATIVE_BRANCHES", "pdf").split(",") if b.strip()]
+SQL_AGENT_TIMEOUT = float(os.getenv("SQL_AGENT_TIMEOUT", "20"))
+PDF_AGENT_TIMEOUT = float(os.getenv("PDF_AGENT_TIMEOUT", "20"))
+OFFERS_TIMEOUT = float(os.getenv("OFFERS_TIMEOUT", "5"))
+
+AGENT_BRANCHES = {
+    "sql": {"categories": {"DB_QUERY", "BOTH"}, "timeout": SQL_AGENT_TIMEOUT},
+    "pdf": {"categories": {"PDF_EXTRACTION", "BOTH"}, "timeout": PDF_AGENT_TIMEOUT},
+    "offers": {"categories": {"EXTERNAL_API"}, "timeout": OFFERS_TIMEOUT},
+}
+
+def branches_for(categories) -> set:
+    return {name for name, branch in AGENT_BRANCHES.items() if branch["categories"] & set(categories)}
+
+async def _await_branch(name: str, future):
+    try:
+        return await asyncio.wait_for(future, timeout=AGENT_BRANCHES[name]["timeout"])
+    except StageBusyError:
+        raise
+    except asyncio.TimeoutError:
+        logger.warning(f"Agent branch '{name}' timed out after {AGENT_BRANCHES[name]['timeout']}s")
+        return {"status": "error", "error": "timeout"}
+    except Exception as e:
+        logger.error(f"Agent branch '{name}' failed: {str(e)}")
+        return {"status": "error", "error": str(e)}
+
+async def _traced(name: str, awaitable):
+    with tracing.span(name):
+        return await awaitable
+
+
+def _timed(name: str, awaitable):
+    # Only wrap the branch when the request is traced
+    return _traced(name, awaitable) if tracing.active() else awaitable
+
+
+async def run_all_agents(query: str, categories=None, classify=None):
+    """
+    Run the SQL, PDF and offers agents concurrently for the given categories.
+    When categories is None, the classify(query) coroutine is awaited first; with speculative
+    retrieval enabled the SPECULATIVE_BRANCHES start while it is still running.
+    Identical queries in flight at the same time share each agent call (see singleflight).
+    Returns (categories, context) where context holds the prompt fields.
+    """
+    key = normalize_query(query)
+    runners = {
+        "sql": lambda: asyncio.ensure_future(flights["sql"].do(key, stages["sql"].run_async, run_sql_agent, query)),
+        "pdf": lambda: asyncio.ensure_future(_timed("retrieval", flights["retrieval"].do(key, stages["retrieval"].run, run_pdf_agent_sync, query))),
+        "offers": lambda: asyncio.ensure_future(_timed("offers", flights["offers"].do("live", stages["retrieval"].run, run_offers_sync))),
+    }
+    futures = {}
+    try:
+        if categories is None:
+            classification = asyncio.ensure_future(_timed("classification", flights["classify"].do(key, stages["classify"].run_async, classify, query)))
+            if SPECULATIVE_RETRIEVAL:
+                for name in SPECULATIVE_BRANCHES:
+                    if name in runners:
+                        futures[name] = runners[name]()
+            categories = await classification
+        wanted = branches_for(categories)
+        for name in list(futures):
+            if name not in wanted:
+                logger.info(f"Discarding speculative agent branch '{name}' for categories {categories}")
+                futures.pop(name).cancel()
+        for name in wanted:
+            if name not in futures:
+                futures[name] = runners[name]()
+        names = list(futures)
+        results = dict(zip(names, await asyncio.gather(*(_await_branch(name, futures[name]) for name in names))))
+    except BaseException:
+        if categories is None:
+            classification.cancel()
+        for future in futures.values():
+            future.cancel()
+        raise
+
+    context = {"sql_data": None, "sql_explanation": None, "pdf_response": None, "api_response": None}
+    if "sql" in results:
+        context["sql_data"] = results["sql"].get("result", "No SQL data available")
+        context["sql_explanation"] = results["sql"].get("explanation", "")
+    if "pdf" in results:
+        context["pdf_response"] = results["pdf"].get("response", "No PDF data available")
+    if "offers" in results:
+        offers = results["offers"].get("result")
+        if offers is None:
+            context["api_response"] = "No offers available"
+        else:
+            sql_rows = results.get("sql", {}).get("result")
+            context["api_response"] = select_offers(offers, query, sql_rows) or "No offers available"
+    return categories, context
+
+async def run_sql_agent(query: str) -> Dict:
     try:
-        return sql_agent.process_query(query)
+        return await sql_agent.process_query(query)
     except Exception as e:
         logger.error(f"SQL Agent error: {str(e)}")
         return {"status": "error", "error": str(e)}
@@ -83,27 +155,23 @@ def run_pdf_agent_sync(query: str) -> Dict:
         logger.error(f"PDF Agent error: {str(e)}")
         return {"status": "error", "error": str(e)}
 
-def get_offers_from_db(db: Session):
+def run_offers_sync() -> Dict:
+    try:
+        return {"status": "success", "result": get_offers_from_db()}
+    except Exception as e:
+        logger.error(f"Offers lookup error: {str(e)}")
+        return {"status": "error", "error": str(e)}
+
+def get_offers_from_db(db: Session = None):
     """
-    Get all offers from the database and serialize them as OfferSchema dicts.
+    Get the live (unexpired) offers as OfferSchema dicts, from the offers cache.
+    A session is only used (or borrowed, when db is None) to (re)load the cache.
     """
     try:
-        offers = db.query(Offer).all()
-        return [OfferSchema.model_validate(offer).model_dump() for offer in offers]
+        return offers_cache.offers(db)
     except Exception as e:
         logger.error(f"Error fetching offers: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail="Error fetching offers"
         )
-
-# Pydantic schema for Offer
-class OfferSchema(BaseModel):
-    id: int
-    product_name: str
-    promo_interest_rate: str | None = None
-    signup_bonus: str | None = None
-    valid_till: date
-
-    class Config:
-        from_attributes = True
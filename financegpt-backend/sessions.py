@@ -0,0 +1,138 @@
+import os
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+from stages import StageBusyError
+from tokens import truncate_tokens
+import metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WS_SESSION_IDLE_TIMEOUT = float(os.getenv("WS_SESSION_IDLE_TIMEOUT", "300"))
+WS_SESSION_HISTORY_TURNS = int(os.getenv("WS_SESSION_HISTORY_TURNS", "8"))
+WS_SESSION_TURN_TOKENS = int(os.getenv("WS_SESSION_TURN_TOKENS", "400"))
+WS_MAX_SESSIONS = int(os.getenv("WS_MAX_SESSIONS", "1000"))
+WS_SESSION_MEMORY_MB = float(os.getenv("WS_SESSION_MEMORY_MB", "32"))
+
+
+def _one_line(text: str) -> str:
+    return " ".join(text.split())
+
+
+class ChatSession:
+    """
+    One authenticated multi-turn connection: the user and profile resolved at
+    connect time, and the last WS_SESSION_HISTORY_TURNS (query, answer) turns.
+    Stored answers are cut to WS_SESSION_TURN_TOKENS; the prompt budget in
+    build_prompt_context decides how much of the history is actually sent.
+    """
+
+    def __init__(self, user, user_profile: Dict, expires_at: Optional[float]):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.user_profile = user_profile
+        self.expires_at = expires_at
+        self.turns = deque(maxlen=WS_SESSION_HISTORY_TURNS)
+        self.size = 0
+        self.queries = 0
+        self.last_active = time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def add_turn(self, query: str, answer: str) -> int:
+        """Append a turn; returns the change in stored bytes."""
+        before = self.size
+        if len(self.turns) == self.turns.maxlen:
+            self.drop_oldest()
+        turn = (_one_line(query), _one_line(truncate_tokens(answer, WS_SESSION_TURN_TOKENS)))
+        self.turns.append(turn)
+        self.size += len(turn[0]) + len(turn[1])
+        self.queries += 1
+        self.last_active = time.monotonic()
+        return self.size - before
+
+    def drop_oldest(self) -> int:
+        if not self.turns:
+            return 0
+        query, answer = self.turns.popleft()
+        self.size -= len(query) + len(answer)
+        return len(query) + len(answer)
+
+    def chat_history(self) -> str:
+        # One line per message, so an over-budget history loses whole messages, oldest first
+        lines = []
+        for query, answer in self.turns:
+            lines.append(f"User: {query}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines)
+
+
+class SessionRegistry:
+    """
+    The worker's open chat sessions, least recently active first. At most
+    WS_MAX_SESSIONS are open at once (more are shed as busy), and when their
+    stored history exceeds WS_SESSION_MEMORY_MB the oldest turns of the least
+    recently active sessions are dropped first.
+    """
+
+    def __init__(self, max_sessions: int = WS_MAX_SESSIONS, memory_limit: int = int(WS_SESSION_MEMORY_MB * 1024 * 1024)):
+        self.max_sessions = max_sessions
+        self.memory_limit = memory_limit
+        self._sessions = OrderedDict()
+        self.memory = 0
+        self.opened = 0
+        self.rejected = 0
+        self.reaped = 0
+        self.trimmed_turns = 0
+
+    def open(self, user, user_profile: Dict, expires_at: Optional[float] = None) -> ChatSession:
+        if len(self._sessions) >= self.max_sessions:
+            self.rejected += 1
+            logger.warning(f"Rejecting chat session: {len(self._sessions)} sessions open")
+            raise StageBusyError("sessions")
+        session = ChatSession(user, user_profile, expires_at)
+        self._sessions[session.id] = session
+        self.opened += 1
+        return session
+
+    def record(self, session: ChatSession, query: str, answer: str):
+        self.memory += session.add_turn(query, answer)
+        self._sessions.move_to_end(session.id)
+        self._enforce_memory()
+
+    def _enforce_memory(self):
+        for session in list(self._sessions.values()):
+            while self.memory > self.memory_limit and session.turns:
+                self.memory -= session.drop_oldest()
+                self.trimmed_turns += 1
+            if self.memory <= self.memory_limit:
+                return
+
+    def close(self, session: ChatSession, idle: bool = False):
+        if self._sessions.pop(session.id, None) is not None:
+            self.memory -= session.size
+            if idle:
+                self.reaped += 1
+
+    def stats(self) -> dict:
+        return {
+            "open": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "memory_bytes": self.memory,
+            "memory_limit_bytes": self.memory_limit,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "idle_reaped": self.reaped,
+            "trimmed_turns": self.trimmed_turns,
+        }
+
+
+sessions = SessionRegistry()
+metrics.register("chat_sessions", sessions.stats)
@@ -0,0 +1,178 @@
+import os
+import asyncio
+import logging
+import functools
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Dict, Hashable, List
+import metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Identical queries in flight at the same time share one classification, SQL,
+# retrieval, offers and recommendations computation. Synthesis is shared only
+# when COALESCE_SYNTHESIS is on, since the answer is then written for the
+# profile bucket rather than the individual profile (see prompt_context.shared_profile).
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+COALESCE_SYNTHESIS = os.getenv("COALESCE_SYNTHESIS", "false").lower() == "true"
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    starts the work as a task and later callers await that same task. The task
+    is cancelled only once every caller has gone away, and the key is forgotten
+    as soon as it finishes, so results are never kept past the flight.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable, *args):
+        """Await fn(*args), or the identical call already in flight under key."""
+        if not COALESCE_REQUESTS:
+            return await fn(*args)
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn(*args)))
+            self._calls[key] = call
+            call.task.add_done_callback(functools.partial(self._forget, key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        call.waiters += 1
+        try:
+            # shield: one caller giving up must not cancel the others' result
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call, _task):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.followers}
+
+
+class _Broadcast:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        # Wake everyone waiting on the current event and start a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class StreamFlight:
+    """
+    Single flight for streams. The first subscriber to a key starts a producer
+    task that reads the upstream generator into a buffer; every subscriber,
+    including one that joins mid-stream, replays the buffer from the start and
+    then follows new chunks as they arrive. Each subscriber sends at its own
+    pace, and the upstream stream is closed only when no subscriber is left.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._streams: Dict[Hashable, _Broadcast] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.late_joiners = 0
+        self.replayed_chunks = 0
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, factory))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            if broadcast.chunks:
+                self.late_joiners += 1
+                self.replayed_chunks += len(broadcast.chunks)
+        broadcast.subscribers += 1
+        try:
+            index = 0
+            while True:
+                if index < len(broadcast.chunks):
+                    yield broadcast.chunks[index]
+                    index += 1
+                elif broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                else:
+                    await broadcast.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                logger.info(f"Last subscriber left stream flight '{self.name}', closing the upstream stream")
+                broadcast.task.cancel()
+
+    async def _produce(self, key: Hashable, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async with aclosing(factory()) as upstream:
+                async for chunk in upstream:
+                    broadcast.chunks.append(chunk)
+                    broadcast.notify()
+        except asyncio.CancelledError:
+            broadcast.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            # Stored rather than raised: every subscriber re-raises it
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            broadcast.notify()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._streams),
+            "subscribers": sum(b.subscribers for b in self._streams.values()),
+            "leaders": self.leaders,
+            "coalesced": self.followers,
+            "late_joiners": self.late_joiners,
+            "replayed_chunks": self.replayed_chunks,
+        }
+
+
+flights = {name: SingleFlight(name) for name in ("classify", "sql", "retrieval", "offers", "recommendations")}
+synthesis_flight = StreamFlight("synthesis")
+
+
+def stats() -> dict:
+    snapshot = {name: flight.stats() for name, flight in flights.items()}
+    snapshot["synthesis"] = synthesis_flight.stats()
+    return snapshot
+
+
+metrics.register("singleflight", stats)
@@ -0,0 +1,126 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "FinanceGPT is busy right now, please try again in a moment."
+
+
+class StageBusyError(Exception):
+    def __init__(self, stage: str):
+        super().__init__(BUSY_MESSAGE)
+        self.stage = stage
+
+
+class Stage:
+    """
+    A bulkhead for one step of the request pipeline: at most `concurrency`
+    requests run the stage at once, up to `max_queue` more wait for a slot and
+    anything beyond that is shed with StageBusyError. Blocking work runs on the
+    stage's own thread pool so it never stalls the event loop or other stages.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, workers: int = 0):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"stage-{name}") if workers else None
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Stage '{self.name}' shedding load: {self.active} active, {self.waiting} queued")
+            raise StageBusyError(self.name)
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.admitted += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+    async def execute(self, fn, *args, **kwargs):
+        """Run a blocking callable on this stage's pool without taking a slot."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def run(self, fn, *args, **kwargs):
+        async with self.slot():
+            return await self.execute(fn, *args, **kwargs)
+
+    async def run_async(self, coro_fn, *args, **kwargs):
+        async with self.slot():
+            return await coro_fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_time_avg": round(self.wait_time_total / self.admitted, 6) if self.admitted else 0.0,
+            "wait_time_max": round(self.wait_time_max, 6),
+        }
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _stage_from_env(name: str, concurrency: int, max_queue: int, workers: int = 0) -> Stage:
+    prefix = f"STAGE_{name.upper()}_"
+    return Stage(
+        name,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        max_queue=int(os.getenv(prefix + "QUEUE", str(max_queue))),
+        workers=int(os.getenv(prefix + "WORKERS", str(workers))),
+    )
+
+
+# Stage defaults: LLM-bound stages are pure asyncio and need no threads;
+# stages that touch Postgres or the vector store get their own pools.
+stages = {
+    "classify": _stage_from_env("classify", concurrency=32, max_queue=128),
+    "sql": _stage_from_env("sql", concurrency=16, max_queue=64, workers=8),
+    "retrieval": _stage_from_env("retrieval", concurrency=16, max_queue=64, workers=8),
+    "synthesis": _stage_from_env("synthesis", concurrency=64, max_queue=128),
+    "recommendations": _stage_from_env("recommendations", concurrency=32, max_queue=64),
+    "db": _stage_from_env("db", concurrency=8, max_queue=256, workers=8),
+}
+
+
+def stats() -> dict:
+    return {name: stage.stats() for name, stage in stages.items()}
+
+
+metrics.register("stages", stats)
+
+
+def shutdown():
+    for stage in stages.values():
+        stage.shutdown()
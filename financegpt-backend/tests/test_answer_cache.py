@@ -0,0 +1,75 @@
+import time
+import numpy as np
+import pytest
+from answer_cache import AnswerCache, chunk_answer, key_terms
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+@pytest.fixture
+def cache():
+    cache = AnswerCache(maxsize=3, ttl=60, threshold=0.98)
+    # Entries are only stored against the data version the cache last saw
+    cache.lookup(_vector(1, 0, 0), "b", 1, "")
+    return cache
+
+
+def test_hit_needs_same_bucket_and_threshold(cache):
+    cache.store(_vector(1, 0, 0), "medium|salaried|25-34", 1, "Best FD rates?", "answer", ["r"])
+    hit = cache.lookup(_vector(1, 0.1, 0), "medium|salaried|25-34", 1, "best FD rates")
+    assert hit["answer"] == "answer" and hit["recommendations"] == ["r"]
+    assert hit["similarity"] >= 0.98
+    assert cache.lookup(_vector(1, 0.1, 0), "high|salaried|25-34", 1, "best FD rates") is None
+    assert cache.lookup(_vector(1, 0.3, 0), "medium|salaried|25-34", 1, "best FD rates") is None
+
+
+def test_named_entities_and_numbers_must_match(cache):
+    cache.store(_vector(1, 0, 0), "b", 1, "What are HDFC FD rates?", "hdfc answer", [])
+    assert cache.lookup(_vector(1, 0, 0), "b", 1, "What are SBI FD rates?") is None
+    assert cache.term_mismatches == 1
+    assert cache.lookup(_vector(1, 0, 0), "b", 1, "what are the HDFC FD rates")["answer"] == "hdfc answer"
+    cache.store(_vector(0, 1, 0), "b", 1, "FDs for 12 months", "twelve", [])
+    assert cache.lookup(_vector(0, 1, 0), "b", 1, "FDs for 24 months") is None
+
+
+def test_falls_through_to_next_best_matching_entry(cache):
+    cache.store(_vector(1, 0, 0), "b", 1, "Tell me about Secure FD Plus", "secure", [])
+    cache.store(_vector(1, 0.15, 0), "b", 1, "Tell me about Wealth Builder FD", "wealth", [])
+    assert cache.lookup(_vector(1, 0.01, 0), "b", 1, "Tell me about Wealth Builder FD")["answer"] == "wealth"
+
+
+def test_key_terms():
+    assert key_terms("Which FDs does HDFC offer for 1,000 rupees?") == {"fd", "hdfc", "1000"}
+    assert key_terms("Tell me about the Ultra Growth Fund") == {"ultra", "growth", "fund"}
+    assert key_terms("I want a safe investment. Any ideas?") == frozenset()
+
+
+def test_version_change_drops_everything(cache):
+    cache.store(_vector(1, 0, 0), "b", 1, "q", "answer", [])
+    assert cache.lookup(_vector(1, 0, 0), "b", (2, 5), "q") is None
+    assert cache.invalidations == 1 and cache.stats()["size"] == 0
+    # An answer written against the old data is not stored
+    cache.store(_vector(1, 0, 0), "b", 1, "q", "stale", [])
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_and_size_cap(cache):
+    for i in range(4):
+        cache.store(_vector(*np.eye(3)[i % 3]), "b", 1, f"q{i}", f"a{i}", [])
+    assert cache.evictions == 1 and cache.stats()["size"] == 3
+    assert cache.lookup(_vector(1, 0, 0), "b", 1, "q3")["answer"] == "a3"
+    cache.ttl = 0.01
+    cache.store(_vector(0, 1, 0), "b", 1, "q", "short lived", [])
+    time.sleep(0.02)
+    assert cache.lookup(_vector(0, 1, 0), "b", 1, "q") is None
+    assert cache.expired == 1
+
+
+def test_chunk_answer_keeps_text_and_word_boundaries():
+    answer = "Secure FD Plus pays 7.2% over 24 months.  Consider the Ultra Growth Fund\nfor long term goals."
+    chunks = chunk_answer(answer, size=20)
+    assert "".join(chunks) == answer
+    assert all(len(chunk) <= 22 for chunk in chunks[:-1])
+    assert all(not chunk[-1].isalnum() or chunk is chunks[-1] for chunk in chunks)
@@ -0,0 +1,42 @@
+import random
+from langchain_core.documents import Document
+from agents.chunking import assemble_context, split_page
+
+
+def _chunk(index: int, page: int = 1) -> Document:
+    # Each chunk repeats the tail of the previous one after its header, as split_page does
+    head = f"[Brochure] overlap{index - 1} "
+    return Document(
+        page_content=head + f"body{index}",
+        metadata={"source": "a.pdf", "page": page, "chunk": index, "body_offset": len(head)},
+    )
+
+
+def test_adjacent_chunks_stitch_in_numeric_order():
+    passages = assemble_context([_chunk(10), _chunk(8), _chunk(9)], max_tokens=1000)
+    assert passages == ["[Brochure] overlap7 body8\nbody9\nbody10"]
+
+
+def test_duplicates_and_other_pages_stay_apart():
+    passages = assemble_context([_chunk(2), _chunk(2), _chunk(3, page=2), _chunk(12)], max_tokens=1000)
+    assert passages == ["[Brochure] overlap1 body2", "[Brochure] overlap2 body3", "[Brochure] overlap11 body12"]
+
+
+def test_chunks_without_index_are_kept_as_is():
+    doc = Document(page_content="plain text", metadata={"source": "b.pdf"})
+    assert assemble_context([doc, _chunk(1)], max_tokens=1000) == ["plain text", "[Brochure] overlap0 body1"]
+
+
+def test_split_page_chunks_reassemble_to_the_page():
+    sentences = [f"Sentence number {i} describes feature {i} of the plan." for i in range(60)]
+    page = Document(page_content="Features:\n" + " ".join(sentences), metadata={"source": "c.pdf", "page": 1})
+    chunks = split_page(page, chunk_tokens=40, overlap_tokens=10)
+    assert len(chunks) > 11
+    picked = chunks[8:12]
+    random.Random(0).shuffle(picked)
+    (passage,) = assemble_context(picked, max_tokens=10000)
+    positions = [passage.find(f"Sentence number {i} ") for i in range(60)]
+    present = [p for p in positions if p >= 0]
+    assert present == sorted(present)
+    # Overlap between stitched chunks is not repeated
+    assert all(passage.count(f"Sentence number {i} ") <= 1 for i in range(60))
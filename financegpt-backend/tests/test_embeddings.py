@@ -0,0 +1,18 @@
+import pytest
+from agents.embeddings import EmbeddingCache, EmbeddingProvider, LocalHashProvider
+
+
+def test_provider_without_embed_batch_cannot_be_constructed():
+    class Incomplete(EmbeddingProvider):
+        provider = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete("model")
+
+
+def test_cache_serves_repeated_texts(tmp_path):
+    provider = LocalHashProvider("hash", cache=EmbeddingCache(str(tmp_path / "cache.sqlite3")))
+    first = provider.embed_documents(["Secure FD Plus", "Ultra Growth Fund"])
+    again = provider.embed_documents(["Ultra Growth Fund", "Secure FD Plus"])
+    assert again == first[::-1]
+    assert provider.cache_hits == 2
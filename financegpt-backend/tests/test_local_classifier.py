@@ -0,0 +1,46 @@
+import pytest
+from agents.local_classifier import LocalClassifier
+
+# LOCAL_CLASSIFIER_THRESHOLD's default
+THRESHOLD = 0.85
+
+
+@pytest.fixture
+def rules_only():
+    classifier = LocalClassifier(path="")
+    assert not classifier.trained
+    return classifier
+
+
+@pytest.mark.parametrize("query, labels", [
+    ("what FDs do you have", ["DB_QUERY"]),
+    ("How many credit cards are available?", ["DB_QUERY"]),
+    ("Explain the premature withdrawal charges", ["PDF_EXTRACTION"]),
+    ("Any festive offers right now?", ["EXTERNAL_API"]),
+    ("What are the features of the Ultra Growth mutual fund?", ["DB_QUERY", "PDF_EXTRACTION"]),
+    ("Show me credit cards with cashback offers", ["DB_QUERY", "EXTERNAL_API"]),
+])
+def test_rules_answer_confidently(rules_only, query, labels):
+    categories, confidence = rules_only.predict(query)
+    assert categories == labels
+    assert confidence >= THRESHOLD
+
+
+@pytest.mark.parametrize("query", ["hello there", "I need some advice"])
+def test_no_rule_hit_falls_back_to_llm(rules_only, query):
+    _, confidence = rules_only.predict(query)
+    assert confidence < THRESHOLD
+
+
+def test_offers_label_needs_offer_words(rules_only):
+    assert rules_only.probabilities("list all fixed deposits")["EXTERNAL_API"] < 0.5
+
+
+def test_trained_model_combines_with_rules():
+    texts = ["tell me about the plan terms", "plan terms and conditions", "list all products", "show products"]
+    labels = [["PDF_EXTRACTION"], ["PDF_EXTRACTION"], ["DB_QUERY"], ["DB_QUERY"]]
+    classifier = LocalClassifier(path="").fit(texts, labels, epochs=300)
+    probs = classifier.probabilities("plan terms")
+    assert probs["PDF_EXTRACTION"] > 0.5
+    # A rule hit still raises its own label
+    assert classifier.probabilities("list all products")["DB_QUERY"] >= 0.95
@@ -0,0 +1,116 @@
+import os
+from decimal import Decimal
+import psycopg2
+import pytest
+from agents.product_snapshot import ProductSnapshot, SnapshotUnsupported, PARITY_QUERIES, same_rows
+from agents.sql_templates import TEMPLATES, template_params
+
+INTEGER = psycopg2.extensions.INTEGER.values[0]
+NUMERIC = psycopg2.extensions.DECIMAL.values[0]
+VARCHAR = 1043
+
+COLUMNS = [
+    ("id", INTEGER, None),
+    ("name", VARCHAR, None),
+    ("type", VARCHAR, None),
+    ("min_amount", NUMERIC, 2),
+    ("tenure_months", INTEGER, None),
+]
+ROWS = [
+    (1, "Secure FD Plus", "Fixed Deposit", Decimal("5000.00"), 24),
+    (2, "Ultra Growth Fund", "Mutual Fund", Decimal("1000.00"), None),
+    (3, "Wealth Builder FD", "Fixed Deposit", Decimal("10000.00"), 36),
+]
+
+
+class FakeSnapshot(ProductSnapshot):
+    """The snapshot without Postgres: fixed rows, tenure_months nullable, C collation."""
+
+    def __init__(self, timeout_ms: int = 5000):
+        super().__init__(pool=type("Pool", (), {"dsn": ""})(), table_name="financial_products", timeout_ms=timeout_ms)
+
+    def _fetch(self):
+        return COLUMNS, ROWS
+
+    def _ordering(self):
+        return {"tenure_months"}
+
+
+@pytest.fixture
+def snapshot():
+    return FakeSnapshot()
+
+
+def test_simple_query_runs_locally(snapshot):
+    rows = snapshot.query("SELECT name, min_amount FROM financial_products WHERE type = 'Fixed Deposit' ORDER BY name", 10)
+    assert rows.columns == ["name", "min_amount"]
+    assert same_rows(rows, [("Secure FD Plus", Decimal("5000.00")), ("Wealth Builder FD", Decimal("10000.00"))])
+    assert snapshot.local_queries == 1
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT name, min_amount / 12 FROM financial_products",
+    "SELECT name FROM financial_products ORDER BY tenure_months DESC LIMIT 1",
+    "SELECT name FROM financial_products ORDER BY 2",
+    "SELECT name FROM financial_products WHERE name LIKE 'S%'",
+    "SELECT name::text FROM financial_products",
+])
+def test_divergent_queries_go_to_postgres(snapshot, sql):
+    with pytest.raises(SnapshotUnsupported):
+        snapshot.query(sql, 10)
+    assert snapshot.unsupported == 1
+
+
+def test_slash_inside_string_literal_stays_local(snapshot):
+    assert snapshot.query("SELECT name FROM financial_products WHERE type = 'Health/Life'", 10) == []
+
+
+def test_order_by_in_subquery_is_checked(snapshot):
+    with pytest.raises(SnapshotUnsupported):
+        snapshot.query("SELECT name FROM (SELECT * FROM financial_products ORDER BY tenure_months LIMIT 2) t", 10)
+
+
+def test_max_rows_applies(snapshot):
+    assert len(snapshot.query("SELECT id FROM financial_products ORDER BY id", 2)) == 2
+
+
+@pytest.mark.parametrize("name", ["product_filter", "product_count"])
+def test_templates_ordering_by_collated_text_go_to_postgres(snapshot, name):
+    # Under a non-C collation type and name sort differently in SQLite
+    snapshot.order_sensitive = {"tenure_months", "type", "name"}
+    with pytest.raises(SnapshotUnsupported):
+        snapshot.query_template(TEMPLATES[name]["sql"], template_params({"type": "Fixed Deposit"}) + (10,))
+    assert snapshot.unsupported == 1
+
+
+def test_template_runs_locally_under_c_collation(snapshot):
+    sql = "SELECT name FROM financial_products WHERE ($1::text IS NULL OR type = $1) ORDER BY min_amount, name LIMIT $2"
+    assert snapshot.query_template(sql, ("Fixed Deposit", 10)) == [("Secure FD Plus",), ("Wealth Builder FD",)]
+    assert snapshot.local_queries == 1
+
+
+def test_slow_query_hits_the_statement_timeout():
+    snapshot = FakeSnapshot(timeout_ms=50)
+    runaway = "WITH RECURSIVE r(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM r) SELECT COUNT(*) FROM r"
+    with pytest.raises(Exception, match="statement timeout"):
+        snapshot.query(runaway, 10)
+    assert snapshot.timeouts == 1
+    # The handler is removed, so the next query runs normally
+    assert len(snapshot.query("SELECT id FROM financial_products ORDER BY id", 10)) == 3
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+def test_parity_with_postgres(monkeypatch):
+    # Every parity query either runs locally with Postgres' result or is sent to Postgres
+    monkeypatch.setenv("DATABASE_URL", os.environ["TEST_DATABASE_URL"])
+    monkeypatch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "test"))
+    from agents.sql_agent import ConnectionPool
+    from sqlalchemy import create_engine
+    engine = create_engine(os.environ["TEST_DATABASE_URL"])
+    try:
+        snapshot = ProductSnapshot(ConnectionPool(engine), "financial_products")
+        report = snapshot.verify(PARITY_QUERIES)
+    finally:
+        engine.dispose()
+    assert report["table_consistent"]
+    assert [p["query"] for p in report["queries"] if not p["same_result"]] == []
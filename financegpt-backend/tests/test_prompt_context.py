@@ -0,0 +1,94 @@
+from decimal import Decimal
+from prompt_context import (CONTEXT_SHARES, _allocate, _fit_lines, age_band, build_prompt_context,
+                            profile_bucket, shared_profile)
+from tokens import count_tokens
+
+PROFILE = {
+    "name": "Asha",
+    "age": 34,
+    "income": "1200000",
+    "employment_type": "Salaried ",
+    "risk_appetite": "Medium",
+    "financial_goals": "Retirement",
+    "credit_score": 760,
+    "kyc_verified": "Yes",
+}
+
+
+def test_age_bands():
+    assert [age_band(a) for a in (18, 25, 34, 45, 59, 60, 90)] == ["<25", "25-34", "25-34", "45-59", "45-59", "60+", "60+"]
+    assert age_band(None) == "unknown"
+
+
+def test_shared_profile_keeps_only_the_bucket():
+    shared = shared_profile(PROFILE)
+    assert shared == {"risk_appetite": "medium", "employment_type": "salaried", "age_band": "25-34"}
+    assert "Asha" not in str(shared) and "1200000" not in str(shared)
+
+
+def test_bucket_ignores_personal_fields():
+    other = dict(PROFILE, name="Ravi", age=29, income="400000", credit_score=640, risk_appetite="medium")
+    assert profile_bucket(other) == profile_bucket(PROFILE) == "medium|salaried|25-34"
+
+
+def test_allocate_gives_small_sources_their_need_and_splits_the_rest_by_share():
+    needs = {"user_profile": 10, "chat_history": 1000, "sql_data": 1000, "pdf_response": 0, "api_response": 0}
+    allocation = _allocate(needs, 1000)
+    assert allocation["user_profile"] == 10
+    assert allocation["pdf_response"] == allocation["api_response"] == 0
+    shares = CONTEXT_SHARES["chat_history"] + CONTEXT_SHARES["sql_data"]
+    assert allocation["chat_history"] == int(990 * CONTEXT_SHARES["chat_history"] / shares)
+    assert allocation["sql_data"] == int(990 * CONTEXT_SHARES["sql_data"] / shares)
+    assert sum(allocation.values()) <= 1000
+
+
+def test_allocate_when_everything_fits():
+    needs = {"user_profile": 5, "chat_history": 20, "sql_data": 30, "pdf_response": 0, "api_response": 7}
+    assert _allocate(needs, 1000) == needs
+
+
+def test_fit_lines_keeps_header_and_first_rows():
+    lines = ["name | rate"] + [f"Product {i} | {i}.5" for i in range(50)]
+    text = _fit_lines(lines, 60, keep_header=True, noun="rows")
+    out = text.split("\n")
+    kept = out[1:-1]
+    assert count_tokens(text) <= 60
+    assert out[0] == "name | rate" and kept == lines[1:1 + len(kept)]
+    assert out[-1] == f"(... {50 - len(kept)} more rows not shown)"
+
+
+def test_fit_lines_from_end_keeps_latest_lines():
+    lines = [f"user: question number {i}" for i in range(40)]
+    text = _fit_lines(lines, 50, keep_header=False, noun="lines", from_end=True)
+    out = text.split("\n")
+    kept = out[1:]
+    assert count_tokens(text) <= 50
+    assert kept == lines[-len(kept):]
+    assert out[0] == f"({40 - len(kept)} earlier lines omitted)"
+
+
+def test_fit_lines_returns_text_that_fits_unchanged():
+    assert _fit_lines(["a", "b"], 100, keep_header=True, noun="rows") == "a\nb"
+
+
+def test_build_prompt_context_respects_the_budget():
+    rows = [(f"Product {i}", "Fixed Deposit", Decimal("7.25"), 5000) for i in range(200)]
+    budget = 400
+    fields, usage = build_prompt_context(
+        {"risk_appetite": "Low"}, {"sql_data": rows, "pdf_response": "", "api_response": None}, budget=budget)
+    sources = ["user_profile", "chat_history", "sql_data", "pdf_response", "api_response"]
+    assert sum(usage[name] for name in sources) <= budget
+    # Empty sources render to nothing and hand their share to the SQL rows
+    assert fields["chat_history"] == fields["pdf_response"] == fields["api_response"] == ""
+    assert usage["sql_data"] > budget * CONTEXT_SHARES["sql_data"]
+    assert fields["user_profile"] == "risk_appetite: Low"
+    assert fields["sql_data"].endswith("more rows not shown)")
+    assert usage["dropped"] > 0
+
+
+def test_build_prompt_context_cuts_free_text_to_its_allocation():
+    history = "\n".join(f"user: message {i}" for i in range(300))
+    fields, usage = build_prompt_context({}, {"pdf_response": "word " * 2000}, chat_history=history, budget=300)
+    assert usage["pdf_response"] + usage["chat_history"] <= 300
+    assert fields["pdf_response"].endswith(" [...]")
+    assert fields["chat_history"].endswith("user: message 299")
@@ -0,0 +1,187 @@
+import asyncio
+import pytest
+import singleflight
+from singleflight import SingleFlight, StreamFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return {"value": value}
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("key", work, 1) for _ in range(5)))
+        # The key is forgotten once the flight lands
+        again = await flight.do("key", work, 2)
+        return flight, results, again
+
+    flight, results, again = asyncio.run(main())
+    assert calls == [1, 2]
+    assert all(result is results[0] for result in results)
+    assert again == {"value": 2}
+    assert flight.stats() == {"in_flight": 0, "leaders": 2, "coalesced": 4}
+
+
+def test_errors_reach_every_caller():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flight = SingleFlight("test")
+        return await asyncio.gather(*(flight.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(main())] == [ValueError] * 3
+
+
+def test_one_caller_cancelling_does_not_cancel_the_others():
+    started = []
+
+    async def work():
+        started.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        flight = SingleFlight("test")
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+def test_work_is_cancelled_when_every_caller_leaves():
+    state = {}
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def main():
+        flight = SingleFlight("test")
+        callers = [asyncio.ensure_future(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.sleep(0.01)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+    assert state == {"cancelled": True}
+
+
+def test_disabled_coalescing_runs_every_call(monkeypatch):
+    monkeypatch.setattr(singleflight, "COALESCE_REQUESTS", False)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(*(SingleFlight("test").do("key", work) for _ in range(3)))
+
+    asyncio.run(main())
+    assert len(calls) == 3
+
+
+def _upstream(chunks, log, delay=0.01):
+    async def stream():
+        log.append("opened")
+        try:
+            for chunk in chunks:
+                await asyncio.sleep(delay)
+                yield chunk
+        finally:
+            log.append("closed")
+    return stream
+
+
+async def _read(flight, key, factory, delay=0.0, stop_after=None):
+    await asyncio.sleep(delay)
+    received = []
+    stream = flight.stream(key, factory)
+    try:
+        async for chunk in stream:
+            received.append(chunk)
+            if stop_after is not None and len(received) == stop_after:
+                break
+    finally:
+        await stream.aclose()
+    return received
+
+
+def test_stream_fans_out_and_late_joiners_replay():
+    chunks = [f"c{i} " for i in range(10)]
+    log = []
+
+    async def main():
+        flight = StreamFlight("test")
+        factory = _upstream(chunks, log)
+        results = await asyncio.gather(
+            _read(flight, "key", factory),
+            _read(flight, "key", factory),
+            # Joins after about half the chunks have been produced
+            _read(flight, "key", factory, delay=0.055),
+        )
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == [chunks, chunks, chunks]
+    assert log == ["opened", "closed"]
+    stats = flight.stats()
+    assert stats["leaders"] == 1 and stats["coalesced"] == 2
+    assert stats["late_joiners"] == 1 and 0 < stats["replayed_chunks"] < len(chunks)
+
+
+def test_stream_survives_a_subscriber_leaving():
+    chunks = [f"c{i} " for i in range(6)]
+    log = []
+
+    async def main():
+        flight = StreamFlight("test")
+        factory = _upstream(chunks, log)
+        return await asyncio.gather(
+            _read(flight, "key", factory, stop_after=2),
+            _read(flight, "key", factory),
+        )
+
+    early, full = asyncio.run(main())
+    assert early == chunks[:2] and full == chunks
+    assert log == ["opened", "closed"]
+
+
+def test_upstream_closes_when_the_last_subscriber_leaves():
+    log = []
+
+    async def main():
+        flight = StreamFlight("test")
+        factory = _upstream([f"c{i}" for i in range(100)], log)
+        await asyncio.gather(*(_read(flight, "key", factory, stop_after=2) for _ in range(2)))
+        await asyncio.sleep(0.02)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+    assert log == ["opened", "closed"]
+
+
+def test_stream_errors_reach_every_subscriber():
+    async def broken():
+        yield "partial"
+        raise RuntimeError("upstream failed")
+
+    async def main():
+        flight = StreamFlight("test")
+        return await asyncio.gather(*(_read(flight, "key", broken) for _ in range(2)), return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(main())] == [RuntimeError, RuntimeError]
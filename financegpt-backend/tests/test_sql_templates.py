@@ -0,0 +1,73 @@
+from decimal import Decimal
+import pytest
+from agents.sql_templates import SLOT_ORDER, TEMPLATES, match_template, template_params
+
+
+def slots(**values):
+    return {**dict.fromkeys(SLOT_ORDER), **values}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("fixed deposits with min amount under 5000", slots(type="Fixed Deposit", min_amount_under=Decimal(5000))),
+    ("FDs below 5000", slots(type="Fixed Deposit", min_amount_under=Decimal(5000))),
+    ("fixed deposits less than 5000", slots(type="Fixed Deposit", min_amount_under=Decimal(5000))),
+    ("fixed deposits up to 5000", slots(type="Fixed Deposit", max_min_amount=Decimal(5000))),
+    ("fixed deposits at most 5000", slots(type="Fixed Deposit", max_min_amount=Decimal(5000))),
+    ("fixed deposits with tenure more than 12 months", slots(type="Fixed Deposit", tenure_over=12)),
+    ("fixed deposits over 12 months", slots(type="Fixed Deposit", tenure_over=12)),
+    ("fixed deposits longer than 12 months", slots(type="Fixed Deposit", tenure_over=12)),
+    ("fixed deposits with tenure at least 12 months", slots(type="Fixed Deposit", min_tenure=12)),
+    ("fixed deposits 12 months or more", slots(type="Fixed Deposit", min_tenure=12)),
+])
+def test_comparatives(query, expected):
+    assert match_template(query) == ("product_filter", expected)
+
+
+@pytest.mark.parametrize("query, amount", [
+    ("mutual funds up to 5k", Decimal(5_000)),
+    ("mutual funds up to 5 thousand", Decimal(5_000)),
+    ("mutual funds up to 1,500", Decimal(1_500)),
+    ("mutual funds up to 2 lakh", Decimal(200_000)),
+    ("mutual funds up to 1.5 lakhs", Decimal(150_000)),
+    ("mutual funds up to rs. 3 lacs", Decimal(300_000)),
+    ("mutual funds up to 1 crore", Decimal(10_000_000)),
+    ("mutual funds up to ₹2 cr", Decimal(20_000_000)),
+])
+def test_amount_units(query, amount):
+    assert match_template(query) == ("product_filter", slots(type="Mutual Fund", max_min_amount=amount))
+
+
+@pytest.mark.parametrize("query, months", [
+    ("fixed deposits at least 2 years", 24),
+    ("fixed deposits at least 3 yrs", 36),
+    ("fixed deposits at least 1 year", 12),
+    ("fixed deposits at least 18 months", 18),
+])
+def test_tenure_units(query, months):
+    assert match_template(query) == ("product_filter", slots(type="Fixed Deposit", min_tenure=months))
+
+
+def test_risk_and_count():
+    assert match_template("how many low risk products are there") == ("product_count", slots(risk_level="Low"))
+    assert match_template("show me moderate-risk mutual funds") == (
+        "product_filter", slots(type="Mutual Fund", risk_level="Medium"))
+
+
+@pytest.mark.parametrize("query", [
+    "show me credit card offers",
+    "what is the best fixed deposit for me",
+    "compare fixed deposits and mutual funds",
+    "fixed deposits with interest rate above 7",
+    "fixed deposits not more than 5 years",
+    "how do i open an account",
+])
+def test_questions_the_templates_cannot_answer(query):
+    assert match_template(query) is None
+
+
+def test_strict_bounds_are_separate_parameters():
+    params = template_params(slots(min_amount_under=Decimal(5000), tenure_over=12))
+    assert params == (None, None, None, Decimal(5000), None, 12)
+    for template in TEMPLATES.values():
+        assert "min_amount < $4" in template["sql"] and "tenure_months > $6" in template["sql"]
+        assert template["param_types"].count(",") + 1 == len(SLOT_ORDER) + 1
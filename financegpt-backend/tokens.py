@@ -0,0 +1,59 @@
+import os
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+# Rough BPE stand-in: words split into ~4 character pieces, punctuation counts
+# as its own token. Only used when the tiktoken encoding cannot be loaded
+# (it is downloaded on first use, which fails on air-gapped hosts).
+_APPROX = re.compile(r"\w{1,4}|[^\w\s]")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    _encoding_failed = True
+                    logger.warning(f"tiktoken encoding {TOKEN_ENCODING} unavailable, approximating token counts: {str(e)}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROX.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens, preferring a word boundary."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        ids = encoding.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return text
+        cut = encoding.decode(ids[:max_tokens])
+    else:
+        pieces = list(_APPROX.finditer(text))
+        if len(pieces) <= max_tokens:
+            return text
+        cut = text[:pieces[max_tokens].start()]
+    boundary = cut.rfind(" ")
+    return cut[:boundary] if boundary > len(cut) // 2 else cut
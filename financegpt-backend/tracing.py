@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional
+import metrics
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+
+STAGE_SECONDS = metrics.Histogram("stage_seconds", "Time spent per pipeline stage of a chat query", ("stage",))
+LLM_TOKENS = metrics.Counter("llm_tokens_total", "LLM tokens by pipeline stage and direction", ("stage", "direction"))
+QUERIES = metrics.Counter("queries_total", "Chat queries traced")
+
+# The trace of the query being served, and the innermost open span. Both are
+# inherited by tasks the request creates, so concurrent branches report into
+# the same trace.
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_stage: ContextVar[str] = ContextVar("trace_stage", default="other")
+_NOOP = nullcontext()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started", "token")
+
+    def __init__(self, trace: "Trace", name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.token = _stage.set(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.record(self.name, time.perf_counter() - self.started)
+        _stage.reset(self.token)
+        return False
+
+
+class Trace:
+    """Stage timings and LLM token counts for one trace_id."""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.tokens = {}
+        self._token = None
+
+    def record(self, stage: str, seconds: float):
+        # Stages that run more than once per query (e.g. retries) accumulate
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tokens(self, stage: str, prompt: int, completion: int):
+        counts = self.tokens.setdefault(stage, [0, 0])
+        counts[0] += prompt
+        counts[1] += completion
+
+    def summary(self) -> Dict:
+        return {
+            "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            "tokens": {stage: {"prompt": p, "completion": c} for stage, (p, c) in self.tokens.items()},
+            "total": round(time.perf_counter() - self.started, 4),
+        }
+
+
+def start(trace_id: str) -> Optional[Trace]:
+    """Begin tracing the current request; returns None when tracing is off."""
+    if not TRACING_ENABLED:
+        return None
+    trace = Trace(trace_id)
+    trace._token = _current.set(trace)
+    return trace
+
+
+def finish(trace: Optional[Trace]) -> Optional[Dict]:
+    """Close the trace, export it to the /metrics histograms and return its summary."""
+    if trace is None:
+        return None
+    _current.reset(trace._token)
+    summary = trace.summary()
+    for stage, seconds in trace.stages.items():
+        STAGE_SECONDS.observe((stage,), seconds)
+    STAGE_SECONDS.observe(("total",), summary["total"])
+    for stage, (prompt, completion) in trace.tokens.items():
+        LLM_TOKENS.inc((stage, "prompt"), prompt)
+        LLM_TOKENS.inc((stage, "completion"), completion)
+    QUERIES.inc()
+    logger.info(f"Trace {trace.trace_id}: {summary}")
+    return summary
+
+
+def span(name: str):
+    """Time a block as stage `name` of the current trace (a shared no-op when untraced)."""
+    trace = _current.get()
+    return _Span(trace, name) if trace is not None else _NOOP
+
+
+def record(name: str, seconds: float):
+    trace = _current.get()
+    if trace is not None:
+        trace.record(name, seconds)
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+def record_tokens(prompt: int, completion: int):
+    """Attribute LLM usage to the innermost open span of the current trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_tokens(_stage.get(), prompt, completion)
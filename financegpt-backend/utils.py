@@ -1,57 +1,105 @@
 import os
 import re
 import json
+import time
 import logging
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from database import SessionLocal
-from models.models import User, QueryLog
+from models.models import User
 from prompts.recommendations_prompt import RECOMMENDATIONS_PROMPT
-from openai import OpenAI
 from pydantic import BaseModel
+from cache import LRUTTLCache, content_hash
+import metrics
+import llm
 
 logger = logging.getLogger(__name__)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
 
-def get_user_info_from_token(token: str):
+# Verified token -> subject, and subject -> (user, profile dict)
+_token_cache = LRUTTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+_profile_cache = LRUTTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+metrics.register("auth_token_cache", _token_cache.stats)
+metrics.register("auth_profile_cache", _profile_cache.stats)
+
+class AuthenticatedUser(BaseModel):
+    id: int
+    email: str
+    name: str
+
+def _verify_token(token: str) -> str:
+    """Return the token's subject, from cache while the verification is fresh."""
+    key = content_hash(token)
+    subject = _token_cache.get(key)
+    if subject is not None:
+        return subject
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-        if user_email is None:
+        subject = payload.get("sub")
+        if subject is None:
             raise Exception("Invalid token: no subject")
     except JWTError as e:
         raise Exception(f"Invalid token: {str(e)}")
+    # Never keep a token cached past its own expiry
+    ttl = AUTH_CACHE_TTL
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        _token_cache.set(key, subject, ttl=ttl)
+    return subject
+
+def _load_user(subject: str):
     db: Session = SessionLocal()
-    user = db.query(User).filter(User.email == user_email).first()
-    if not user or not user.profile:
+    try:
+        user = (
+            db.query(User)
+            .options(joinedload(User.profile))
+            .filter(User.email == subject)
+            .first()
+        )
+        if not user or not user.profile:
+            raise Exception("User not found or profile missing")
+        user_profile_dict = {
+            "name": user.profile.name,
+            "age": user.profile.age,
+            "income": str(user.profile.income),
+            "employment_type": user.profile.employment_type,
+            "risk_appetite": user.profile.risk_appetite,
+            "financial_goals": user.profile.financial_goals,
+            "credit_score": user.profile.credit_score,
+            "kyc_verified": user.profile.kyc_verified
+        }
+        return AuthenticatedUser(id=user.id, email=user.email, name=user.profile.name), user_profile_dict
+    finally:
+        # The session is only borrowed for this one query
         db.close()
-        raise Exception("User not found or profile missing")
-    user_profile_dict = {
-        "name": user.profile.name,
-        "age": user.profile.age,
-        "income": str(user.profile.income),
-        "employment_type": user.profile.employment_type,
-        "risk_appetite": user.profile.risk_appetite,
-        "financial_goals": user.profile.financial_goals,
-        "credit_score": user.profile.credit_score,
-        "kyc_verified": user.profile.kyc_verified
-    }
-    return user, user_profile_dict, db
 
-def generate_recommendations(user_query, assistant_answer):
+def get_user_info_from_token(token: str):
+    """
+    Verify the JWT and return (user, profile dict). Both are cached for
+    AUTH_CACHE_TTL seconds; no database session is held after this returns.
+    """
+    subject = _verify_token(token)
+    cached = _profile_cache.get(subject)
+    if cached is None:
+        cached = _load_user(subject)
+        _profile_cache.set(subject, cached)
+    user, user_profile_dict = cached
+    return user, dict(user_profile_dict)
+
+def invalidate_user(subject: str):
+    """Drop the cached profile for subject; call after changing a user or profile."""
+    _profile_cache.invalidate(subject)
+
+async def generate_recommendations(user_query, assistant_answer):
     rec_prompt = RECOMMENDATIONS_PROMPT.format(user_query=user_query, assistant_answer=assistant_answer)
     try:
-        rec_response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": rec_prompt}],
-            temperature=0.2,
-            max_tokens=256
-        )
-        rec_text = rec_response.choices[0].message.content.strip()
-        logger.error(f"Raw LLM recommendations output: {rec_text}")
+        rec_text = (await llm.complete(rec_prompt, temperature=0.2, max_tokens=256)).strip()
+        logger.debug(f"Raw LLM recommendations output: {rec_text}")
         try:
             recommendations = json.loads(rec_text)
         except Exception:
@@ -70,19 +118,5 @@ def generate_recommendations(user_query, assistant_answer):
         recommendations = []
     return recommendations
 
-def log_query(trace_id, user, query, answer, processing_time, db):
-    confidence_score = 1.0
-    query_log = QueryLog(
-        trace_id=trace_id,
-        user_id=user.id,
-        user_name=user.profile.name,
-        query=query,
-        answer=answer,
-        confidence_score=confidence_score,
-        processing_time=processing_time
-    )
-    db.add(query_log)
-    db.commit()
-
 class QueryRequest(BaseModel):
     query: str 
\ No newline at end of file